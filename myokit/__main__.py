@@ -1824,36 +1824,33 @@ def test_in_repo():
     return os.path.isfile(os.path.join('myokit', '_myokit_version.py'))
 
 
-def test_mmt_files(path):
+def test_mmt_file(path, fn):
     """
-    Run all the `mmt` files in a given directory `path`, returns 0 iff nothing
-    goes wrong.
+    Loads and runs the `mmt` file `fn` in the directory `path`, and returns a
+    tuple ``(error, output)``, where ``error`` is 0 iff nothing goes wrong and
+    ``output`` is a string containing everything printed to ``sys.stdout`` and
+    ``sys.stderr`` while running. Output written directly to the underlying
+    file descriptors (e.g. by compiled simulation code) is not captured.
+
+    Used by :meth:`test_mmt_files()`, which calls it in parallel processes.
     """
-    import fnmatch
+    import contextlib
     import gc
+    import io
     import os
     import traceback
 
     import myokit
 
-    # Get absolute path
-    path = os.path.abspath(path)
-
-    # Show what we're running
-    print('Running mmt files for:')
-    print('  ' + path)
-
-    # Error state
     error = 0
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output), \
+            contextlib.redirect_stderr(output):
+        # Set working directory to that path
+        wdir = os.getcwd()
+        try:
+            os.chdir(path)
 
-    # Set working directory that that path
-    wdir = os.getcwd()
-    try:
-        os.chdir(path)
-
-        # Run all
-        glob = '*.mmt'
-        for fn in fnmatch.filter(os.listdir(path), glob):
             # Load and run
             try:
                 print('Loading ' + fn)
@@ -1871,13 +1868,61 @@ def test_mmt_files(path):
 
             # Tidy up
             gc.collect()
+        finally:
+            os.chdir(wdir)
+
+    return error, output.getvalue()
+
+
+def test_mmt_files(path):
+    """
+    Run all the `mmt` files in a given directory `path`, returns 0 iff nothing
+    goes wrong.
+
+    The files are run in parallel processes, but their output is shown in
+    order, and no further output is shown after the first error. Unlike in a
+    sequential run, files after the first failing one may already have run
+    (or be running) when the error is detected: files that haven't started
+    yet are cancelled, but running files are allowed to finish.
+    """
+    import concurrent.futures
+    import concurrent.futures.process
+    import os
+
+    # Get absolute path
+    path = os.path.abspath(path)
+
+    # Show what we're running
+    print('Running mmt files for:')
+    print('  ' + path)
+
+    # Error state
+    error = 0
+
+    # Run all
+    files = [
+        entry.name for entry in os.scandir(path)
+        if entry.is_file() and entry.name.endswith('.mmt')]
+    with concurrent.futures.ProcessPoolExecutor() as pool:
+        futures = [pool.submit(test_mmt_file, path, fn) for fn in files]
+        for fn, future in zip(files, futures):
+            try:
+                error, output = future.result()
+            except concurrent.futures.process.BrokenProcessPool:
+                # A worker was terminated abruptly, e.g. by a crash in
+                # compiled code. This breaks the whole pool, so the crash may
+                # have been caused by this file or by one running alongside it.
+                error = 1
+                output = ('Worker process terminated unexpectedly while'
+                          ' running ' + fn + ' (or a file run in parallel).\n')
+            print(output, end='')
             print('-' * 70)
 
             # Quit on error
             if error:
+                for f in futures:
+                    f.cancel()
                 break
-    finally:
-        os.chdir(wdir)
 
     # Return error status 0
     return error
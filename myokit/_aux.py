@@ -10,8 +10,9 @@ import myokit
 
 import sys
 
-# Globally shared numpy expression writer
+# Globally shared numpy expression writers
 _numpywriter_ = None
+_numpywriter_elementwise_ = None
 
 # Globally shared python expression writer
 _pywriter_ = None
@@ -373,7 +374,7 @@ class ModelComparison:
         self._diff.append(text)
 
 
-def numpy_writer():
+def numpy_writer(elementwise_logic=False):
     """
     Returns a globally shared numpy expression writer.
 
@@ -384,11 +385,16 @@ def numpy_writer():
 
     This convention ensures a unique mapping of a model's lhs expressions to
     acceptable python variable names.
+
+    If ``elementwise_logic`` is set to ``True``, a second shared writer is
+    returned, that writes ``and``, ``or``, and ``not`` as element-wise numpy
+    functions (see :class:`myokit.formats.python.NumPyExpressionWriter`).
     """
-    global _numpywriter_
-    if _numpywriter_ is None:
+    global _numpywriter_, _numpywriter_elementwise_
+    w = _numpywriter_elementwise_ if elementwise_logic else _numpywriter_
+    if w is None:
         from .formats.python import NumPyExpressionWriter
-        _numpywriter_ = NumPyExpressionWriter()
+        w = NumPyExpressionWriter(elementwise_logic)
 
         def name(x):
             u = x.var()
@@ -397,9 +403,13 @@ def numpy_writer():
                 u = x.var().qname().replace('.', '_')
             return '_d_' + u if x.is_derivative() else u
 
-        _numpywriter_.set_lhs_function(name)
+        w.set_lhs_function(name)
+        if elementwise_logic:
+            _numpywriter_elementwise_ = w
+        else:
+            _numpywriter_ = w
 
-    return _numpywriter_
+    return w
 
 
 def python_writer():
@@ -5,8 +5,9 @@
 # This file is part of Myokit.
 # See http://myokit.org for copyright, sharing, and licensing details.
 #
-import io
 import math
+import operator
+
 import numpy
 
 import myokit
@@ -14,6 +15,10 @@ import myokit
 from myokit import IntegrityError
 
 
+# Shared references set for expressions without any references
+_NO_REFERENCES = frozenset()
+
+
 # Expression precedence levels
 FUNCTION_CALL = 70
 POWER = 60
@@ -25,6 +30,76 @@ CONDITION_AND = 10
 LITERAL = 0
 
 
+def _divide(a, b):
+    """ Division as performed by :meth:`Divide._eval()`. """
+    if b == 0:
+        raise ZeroDivisionError()
+    return a / b
+
+
+def _scalar_function(fmath, fnumpy):
+    """
+    Returns a function that evaluates ``fmath(x)`` if ``x`` is a float, and
+    ``fnumpy(x)`` if it isn't (e.g. in single precision) or if ``fmath(x)``
+    fails.
+
+    This avoids the overhead of calling numpy functions on scalars, while
+    keeping numpy's results for invalid input (e.g. ``nan`` for
+    ``sqrt(-1)``, instead of an exception). The result of ``fmath(x)`` is
+    converted to a ``numpy.float64``, so that any further arithmetic on it
+    follows numpy's rules (e.g. ``inf`` or ``nan`` instead of an exception
+    for ``log(2) / 0``, as when ``fnumpy`` is used).
+
+    This should only be used where ``fmath`` and ``fnumpy`` give identical
+    results, so that :meth:`Expression.eval()` agrees with
+    :meth:`Expression.eval_many()` and :meth:`Expression.pyfunc()`.
+    """
+    def f(x):
+        if isinstance(x, float):
+            try:
+                return numpy.float64(fmath(x))
+            except (ArithmeticError, ValueError):
+                pass
+        return fnumpy(x)
+    return f
+
+
+def _math_floor(x):
+    # Like numpy.floor, keep the sign of x for a zero result
+    return math.copysign(math.floor(x), x)
+
+
+def _math_ceil(x):
+    # Like numpy.ceil, keep the sign of x for a zero result, e.g. -0.0 for -0.3
+    return math.copysign(math.ceil(x), x)
+
+
+# Functions used by the _eval() methods of Function subclasses. The math
+# module is only used where its results are exact or correctly rounded: numpy
+# and the platform's math library can differ in the last bit for others.
+_sqrt = _scalar_function(math.sqrt, numpy.sqrt)
+_sin = numpy.sin
+_cos = numpy.cos
+_tan = numpy.tan
+_asin = numpy.arcsin
+_acos = numpy.arccos
+_atan = numpy.arctan
+_exp = numpy.exp
+_log = numpy.log
+_log10 = numpy.log10
+_floor = _scalar_function(_math_floor, numpy.floor)
+_ceil = _scalar_function(_math_ceil, numpy.ceil)
+_abs = _scalar_function(abs, numpy.abs)
+
+# Global variables available to code compiled by Expression._compile_eval()
+_COMPILE_GLOBALS = {
+    '_divide': _divide, '_sqrt': _sqrt, '_sin': _sin, '_cos': _cos,
+    '_tan': _tan, '_asin': _asin, '_acos': _acos, '_atan': _atan,
+    '_exp': _exp, '_log': _log, '_log10': _log10, '_floor': _floor,
+    '_ceil': _ceil, '_abs': _abs,
+}
+
+
 class Expression:
     """
     Myokit's most generic interface for expressions. All expressions extend
@@ -39,6 +114,9 @@ class Expression:
 
     *Abstract class*
     """
+    __slots__ = ('_token', '_operands', '_references', '_has_partials',
+                 '_cached_hash', '_cached_polish', '_cached_validation',
+                 '_cached_unit', '_cached_pyfunc', '_cached_eval')
     _rbp = None     # Right-binding power (see parser).
     _rep = ''       # Mmt representation
     _treeDent = 2   # Tab size used when displaying as tree.
@@ -47,18 +125,27 @@ class Expression:
         self._token = None
 
         # Store operands
-        self._operands = () if operands is None else operands
-
-        # Store references
-        self._references = set()
-        for op in self._operands:
-            self._references |= op._references
-
-        # Contains partial derivatives?
-        self._has_partials = False
-        for op in self._operands:
+        ops = self._operands = () if operands is None else tuple(operands)
+
+        # Store references, and check if there are any partial derivatives.
+        # Both are done in a single pass: for the small number of operands
+        # that most expressions have, an explicit loop beats any() or union().
+        # References are stored as immutable frozensets, so that an operand's
+        # set can be shared if no other operand contributes any new
+        # references (e.g. in ``x * x`` or ``x + x * y``).
+        refs = _NO_REFERENCES
+        partials = False
+        for op in ops:
+            r = op._references
+            if r and r is not refs:
+                if not refs or refs < r:
+                    refs = r
+                elif not r <= refs:
+                    refs = refs | r
             if op._has_partials:
-                self._has_partials = True
+                partials = True
+        self._references = refs
+        self._has_partials = partials
 
         # Cached results:
         # Since expressions are immutable, the results of many methods can be
@@ -67,8 +154,9 @@ class Expression:
         self._cached_hash = None
         self._cached_polish = None
         self._cached_validation = None
-        self._cached_unit_tolerant = None
-        self._cached_unit_strict = None
+        self._cached_unit = None
+        self._cached_pyfunc = None
+        self._cached_eval = None
 
     def __bool__(self):
         # Determines the outcome of "if expression".
@@ -109,6 +197,10 @@ class Expression:
         Substitution takes precedence over expansion: A call such as
         ``e.clone(subst={x:y}, expand=True) will replace ``x`` by ``y`` but not
         expand any names appearing in ``y``.
+
+        Because expressions are immutable, any (sub)expression that would be
+        unchanged by cloning is not copied, but returned as is. As a result,
+        ``e.clone()`` returns ``e`` itself.
         """
         raise NotImplementedError
 
@@ -127,18 +219,24 @@ class Expression:
         """
         # Note: Because variable and component names can change, the output of
         # code can not be cached (for non-literal expressions).
-        b = io.StringIO()
-        self._code(b, component)
-        return b.getvalue()
+        b = []
+        self._code(b.append, component)
+        return ''.join(b)
 
     def _code(self, b, c):
         """
-        Internal version of ``code()``, should write the generated code to the
-        stringbuffer ``b``, from the context of component ``c``.
+        Internal version of ``code()``, should write the generated code by
+        passing strings to the callable ``b`` (e.g. a list's ``append``
+        method), from the context of component ``c``.
         """
         raise NotImplementedError
 
     def __contains__(self, key):
+        # Check for identity first: comparing with the other operands using
+        # ``==`` could require their hashes to be calculated.
+        for op in self._operands:
+            if op is key:
+                return True
         return key in self._operands
 
     def contains_type(self, kind):
@@ -146,13 +244,17 @@ class Expression:
         Returns True if this expression tree contains an expression of the
         given type.
         """
-        if isinstance(self, kind):
-            return True
+        # Partial derivatives are tracked at construction
         if kind == PartialDerivative:
             return self._has_partials
-        for op in self:
-            if op.contains_type(kind):
+
+        # Iterative depth-first search
+        stack = [self]
+        while stack:
+            e = stack.pop()
+            if isinstance(e, kind):
                 return True
+            stack.extend(e._operands)
         return False
 
     def depends_on(self, lhs, deep=False):
@@ -363,10 +465,14 @@ class Expression:
             return True
         elif type(self) != type(other):
             return False
+        elif hash(self) != hash(other):
+            # Hashes are cached, so this rules out most unequal expressions
+            # without comparing their full polish representations.
+            return False
         else:
             # Compare cached polish expression (which uses ids)
             # Note that the polish representation uses object ids instead of
-            # qnames
+            # qnames.
             return self._polish() == other._polish()
 
     def eval(self, subst=None, precision=myokit.DOUBLE_PRECISION):
@@ -404,12 +510,27 @@ class Expression:
                             ' or numbers.')
                     subst[k] = myokit.Number(v)
 
-        # Evaluate
+        return self._evaluate(subst, precision)
+
+    def _evaluate(self, subst, precision):
+        """
+        Evaluates this expression like :meth:`eval()`, but without checking
+        the ``subst`` argument, which must be ``None`` or a dict mapping
+        :class:`LhsExpression` objects to :class:`Expression` objects.
+        """
         try:
+            # Use a compiled function, for double precision evaluations of
+            # expressions that have been evaluated before.
+            if precision != myokit.SINGLE_PRECISION:
+                f = self._evaluator()
+                if f is not None:
+                    return f(subst, precision)
+
             return self._eval(subst, precision)
-        except EvalError as e:
+        except (ArithmeticError, ValueError) as err:
 
-            # It went wrong! Create a nice error message.
+            # It went wrong! Find out where, and create a nice error message.
+            e = _eval_error(self, subst, precision, err)
             out = [_expr_error_message(self, e)]
 
             # Show values of operands
@@ -420,7 +541,7 @@ class Expression:
                     pre = '  (' + str(1 + i) + ') '
                     try:
                         out.append(pre + str(op._eval(subst, precision)))
-                    except EvalError:
+                    except (ArithmeticError, ValueError):
                         out.append(pre + 'another error')
 
             # Show variables included in expression
@@ -446,7 +567,7 @@ class Expression:
 
                     try:
                         out.append(pre + str(rhs._eval(subst, precision)))
-                    except EvalError:
+                    except (ArithmeticError, ValueError):
                         out.append(pre + 'another error')
 
             # Raise new exception with better message
@@ -459,6 +580,154 @@ class Expression:
         """
         raise NotImplementedError
 
+    def _eval_operands(self, subst, precision):
+        """
+        Returns an iterable over the operands that ``_eval(subst, precision)``
+        evaluates, in the order it evaluates them.
+
+        This is used by ``_eval_error()`` to find the sub-expression that
+        caused an error. Expressions that don't evaluate all of their
+        operands (e.g. conditionals) or that evaluate other expressions (e.g.
+        references) should override this method.
+        """
+        return self._operands
+
+    def _evaluator(self):
+        """
+        Returns a compiled function to evaluate this expression with, or
+        ``None`` if this expression has not been evaluated before.
+
+        Expressions are only compiled on their second evaluation, so that
+        expressions that are evaluated just once don't pay the compilation
+        cost.
+        """
+        f = self._cached_eval
+        if f is None:
+            self._cached_eval = False
+            return None
+        if f is False:
+            f = self._cached_eval = self._compile_eval()
+        return f
+
+    def _eval_code(self, b, o):
+        """
+        Writes Python code to evaluate this expression, for use by
+        :meth:`_compile_eval()`, by passing strings to the callable ``b``.
+
+        The generated code has access to the arguments ``s`` and ``p`` of
+        ``_eval(subst, precision)``, and to a tuple ``_o`` of objects that it
+        can call ``_eval(s, p)`` on. The list ``o`` is used to build this
+        tuple. This default implementation adds this expression to ``o``, and
+        so can be used by any expression, including all references.
+        """
+        b('_o[' + str(len(o)) + ']._eval(s, p)')
+        o.append(self)
+
+    def _compile_eval(self):
+        """
+        Compiles this expression into a Python function ``f(subst, precision)``
+        that returns the same result as ``_eval(subst, precision)`` for double
+        precision evaluation, but without a Python method call for every node.
+
+        The function may raise exceptions, which can be passed to
+        ``_eval_error()`` to find the sub-expression that caused them.
+
+        References are evaluated with ``_eval``, inside the generated code, so
+        that any substitutions and changes to the model are taken into
+        account, and the generated code can be cached. References that appear
+        more than once are evaluated only once per call, and only when first
+        needed (so that e.g. untaken ``if`` branches are still skipped).
+        """
+        b = []
+        o = []
+        try:
+            self._eval_code(b.append, o)
+            code = ''.join(b)
+
+            # Store repeated references in a dict ``c``, created for each call
+            cached = False
+            for k in range(len(o)):
+                ref = '_o[' + str(k) + ']._eval(s, p)'
+                if code.count(ref) > 1:
+                    cached = True
+                    code = code.replace(ref, '(c[' + str(k) + '] if ' + str(k)
+                                        + ' in c else c.setdefault(' + str(k)
+                                        + ', ' + ref + '))')
+            if cached:
+                code = '(lambda c: ' + code + ')({})'
+
+            g = dict(_COMPILE_GLOBALS)
+            g['_o'] = tuple(o)
+            return eval('lambda s, p: ' + code, g)
+        except (SyntaxError, RecursionError, MemoryError):
+            # Very deeply nested expressions can't be compiled
+            return self._eval
+
+    def eval_many(self, subst=None, precision=myokit.DOUBLE_PRECISION):
+        """
+        Evaluates this expression for arrays of values, and returns the
+        results as a numpy array.
+
+        The argument ``subst`` should be a dictionary mapping
+        :class:`LhsExpression` objects to arrays (or scalars) of values to
+        substitute them with. The arrays must have the same shape, or shapes
+        that can be broadcast together. References that do not appear in
+        ``subst`` are evaluated as in :meth:`eval()`.
+
+        Instead of calling :meth:`eval()` for every set of values, this method
+        makes a single call to a function like the one created by
+        :meth:`pyfunc()`, with numpy arrays as arguments. As a result,
+        numerical errors (e.g. a division by zero) result in ``nan`` or ``inf``
+        values (and numpy warnings), instead of an exception. In addition, all
+        operands of ``and`` and ``or`` are evaluated, so that e.g. ``x != 0 and
+        1 / x > 2`` evaluates ``1 / x`` even where ``x`` is zero.
+
+        The argument ``precision`` can be set to ``myokit.SINGLE_PRECISION``
+        to perform the evaluation with 32 bit floating point numbers.
+        """
+        # Check subst dict
+        if subst:
+            try:
+                subst = dict(subst)
+            except TypeError:
+                raise ValueError('Argument `subst` must be dict or None.')
+            for k in subst:
+                if not isinstance(k, myokit.LhsExpression):
+                    raise ValueError(
+                        'All keys in `subst` must LhsExpression objects.')
+        else:
+            subst = {}
+
+        # Gather arguments. As in eval(), the substitutions are also applied
+        # when evaluating a reference's RHS.
+        dtype = numpy.float32 if precision == myokit.SINGLE_PRECISION \
+            else numpy.float64
+        refs = list(self._references)
+        args = []
+        for ref in refs:
+            if ref in subst:
+                v = subst[ref]
+                if isinstance(v, Expression):
+                    v = v.eval(precision=precision)
+            else:
+                rhs = ref.rhs()
+                if rhs is None:
+                    v = ref.eval(precision=precision)
+                elif rhs._references:
+                    v = rhs.eval_many(subst, precision)
+                else:
+                    # Literals (e.g. constants) don't need a vectorised call
+                    v = rhs.eval(precision=precision)
+            args.append(numpy.asarray(v, dtype=dtype))
+
+        # Evaluate, and return array with the broadcast shape. Conditions are
+        # evaluated element-wise, so that "and", "or", and "not" work on arrays
+        f = self._pyfunc(myokit.numpy_writer(True), {'numpy': numpy}, refs)
+        r = numpy.asarray(f(*args))
+        if r.dtype.kind == 'f':
+            r = r.astype(dtype, copy=False)
+        return numpy.array(numpy.broadcast_arrays(r, *args)[0])
+
     def eval_unit(self, mode=myokit.UNIT_TOLERANT):
         """
         Evaluates the unit this expression should have, based on the units of
@@ -492,10 +761,8 @@ class Expression:
         In tolerant mode, ``None`` will be returned if the units are unknown.
         """
         # Get cached unit or error
-        if mode == myokit.UNIT_STRICT:
-            result = self._cached_unit_strict
-        else:
-            result = self._cached_unit_tolerant
+        i = 0 if mode == myokit.UNIT_STRICT else 1
+        result = None if self._cached_unit is None else self._cached_unit[i]
 
         # Evaluate and cache
         if result is None:
@@ -507,10 +774,12 @@ class Expression:
                     e.expr._token
                 )
 
-            if mode == myokit.UNIT_STRICT:
-                self._unit_strict = result
-            else:
-                self._unit_tolerant = result
+            # Variable units can change, so only cache if there are no
+            # references to variables (or other potentially mutable objects)
+            if not self._references:
+                if self._cached_unit is None:
+                    self._cached_unit = [None, None]    # Strict, tolerant
+                self._cached_unit[i] = result
 
         # Raise error or return
         if isinstance(result, myokit.IncompatibleUnitError):
@@ -529,7 +798,7 @@ class Expression:
 
     def __hash__(self):
         if self._cached_hash is None:
-            self._cached_hash = hash(self._polish())
+            self._cached_hash = self._hash()
         return self._cached_hash
         # Note: anything that has an __eq__ stops inheriting this hash method!
         # From: https://docs.python.org/3.1/reference/datamodel.html
@@ -575,7 +844,7 @@ class Expression:
         """
         Returns ``True`` if this expression does not contain any references.
         """
-        return len(self._references) == 0
+        return not self._references
 
     def is_name(self, var=None):
         """
@@ -616,6 +885,19 @@ class Expression:
         """
         return self._rep
 
+    def _hash(self):
+        """
+        Internal part of __hash__(), returns a (not yet cached) hash for this
+        expression.
+
+        Any two expressions with the same :meth:`_polish()` output must have
+        the same hash. By default, the polish string is hashed, but composite
+        expressions can override this to combine the (cached) hashes of their
+        operands instead, so that hashing doesn't require the creation of
+        polish strings for the full tree.
+        """
+        return hash(self._polish())
+
     def _polish(self):
         """
         Returns a reverse-polish notation version of this expression's code,
@@ -627,22 +909,28 @@ class Expression:
         variable id is immutable in the expression's lifetime.
         """
         if self._cached_polish is None:
-            b = io.StringIO()
-            self._polishb(b)
-            self._cached_polish = b.getvalue()
+            b = []
+            self._polishb(b.append)
+            self._cached_polish = ''.join(b)
         return self._cached_polish
 
     def _polishb(self, b):
         """
-        Recursive part of _polish(). Should write the generated code to the
-        stringbuffer b.
+        Internal part of _polish(). Should write the generated code by passing
+        strings to the callable ``b``.
+
+        Operands should be written by calling their ``_polishb(b)`` method
+        with the same callable ``b``, so that only the expression on which
+        ``_polish()`` was called caches its string. (Caching the strings of all
+        operands would make time and memory use grow with the depth of the
+        expression, as every subtree's string contains all of its operands'.)
 
         Because hash() and others use _polish(), this function should never
         use eval() or other advanced functions.
         """
         raise NotImplementedError
 
-    def pyfunc(self, use_numpy=True):
+    def pyfunc(self, use_numpy=True, args=None):
         """
         Converts this expression to Python and returns the new function's
         handle.
@@ -650,27 +938,57 @@ class Expression:
         By default, when converting mathematical functions such as ``log``, the
         version from ``numpy`` (i.e. ``numpy.log``) is used. To use the
         built-in ``math`` module instead, set ``use_numpy=False``.
+
+        The created function has an argument for every reference in this
+        expression, in no particular order. To fix the order, pass in a
+        sequence of :class:`LhsExpression` objects as ``args``. This must
+        include all references, but may also contain expressions that this
+        expression does not depend on (so that several functions can be given
+        the same signature).
+
+        The function is cached, so that calling this method again with the
+        same arguments (and unchanged variable names) does not lead to new
+        code being compiled.
         """
-        # Get expression writer
         if use_numpy:
-            w = myokit.numpy_writer()
+            return self._pyfunc(myokit.numpy_writer(), {'numpy': numpy}, args)
+        return self._pyfunc(myokit.python_writer(), {'math': math}, args)
+
+    def _pyfunc(self, w, env, args):
+        """
+        Creates and returns a function for :meth:`pyfunc()`, using the
+        expression writer ``w`` and a dict ``env`` of globals for the created
+        function.
+        """
+        # Check arguments
+        if args is None:
+            args = self._references
         else:
-            w = myokit.python_writer()
+            args = list(args)
+            for ref in self._references:
+                if ref not in args:
+                    raise ValueError(
+                        'The argument `args` must include all references in'
+                        ' the expression, but ' + str(ref) + ' was missing.')
 
         # Create function text
-        args = [w.ex(x) for x in self._references]
+        args = [w.ex(x) for x in args]
         c = 'def ex_pyfunc_generated(' + ','.join(args) + '):\n    return ' \
             + w.ex(self)
 
+        # Return cached function, if the code hasn't changed. Because variable
+        # names can change, the code itself can not be cached.
+        if self._cached_pyfunc is not None and self._cached_pyfunc[0] == c:
+            return self._cached_pyfunc[1]
+
         # Create function
         local = {}
-        if use_numpy:
-            exec(c, {'numpy': numpy}, local)
-        else:
-            exec(c, {'math': math}, local)
+        exec(c, env, local)
+        f = local['ex_pyfunc_generated']
 
-        # Return
-        return local['ex_pyfunc_generated']
+        # Cache and return
+        self._cached_pyfunc = (c, f)
+        return f
 
     def pystr(self, use_numpy=False):
         """
@@ -716,9 +1034,9 @@ class Expression:
         Returns a string representing the parse tree corresponding to this
         expression.
         """
-        b = io.StringIO()
-        self._tree_str(b, 0)
-        return b.getvalue()
+        b = []
+        self._tree_str(b.append, 0)
+        return ''.join(b)
 
     def _tree_str(self, b, n):
         raise NotImplementedError
@@ -728,39 +1046,46 @@ class Expression:
         Validates operands, checks cycles without following references. Will
         raise exceptions if errors are found.
         """
-        return self._validate([])
+        return self._validate(set())
 
     def _validate(self, trail):
         """
-        The argument ``trail`` is used to check for cyclical refererences.
+        The argument ``trail`` is a set of the ids of all expressions currently
+        being validated, and is used to check for cyclical refererences.
         """
         if self._cached_validation:
             return
 
         # Check for cyclical dependency
-        if id(self) in trail:
-            raise IntegrityError('Cyclical expression found', self._token)
-        trail2 = trail + [id(self)]
-
         # It's okay to do this check with id's. Even if there are multiple
         # objects that are equal, if they're cyclical you'll get back round to
         # the same ones eventually. Doing this with the value requires hash()
         # which requires code() which may not be safe to use before the
         # expressions have been validated.
-        for op in self:
-            if not isinstance(op, Expression):
-                raise IntegrityError(
-                    'Expression operands must be other Expression objects.'
-                    ' Found: ' + str(type(op)) + '.', self._token)
-            op._validate(trail2)
+        i = id(self)
+        if i in trail:
+            raise IntegrityError('Cyclical expression found', self._token)
+
+        # Validate operands, using a single trail that objects are added to and
+        # removed from as the tree is traversed.
+        trail.add(i)
+        try:
+            for op in self:
+                if not isinstance(op, Expression):
+                    raise IntegrityError(
+                        'Expression operands must be other Expression'
+                        ' objects. Found: ' + str(type(op)) + '.',
+                        self._token)
+                op._validate(trail)
+        finally:
+            trail.discard(i)
 
         # Cache validation status
         self._cached_validation = True
 
     def walk(self, allowed_types=None):
         """
-        Returns an iterator over this expression tree (depth-first). This is a
-        slow operation. Do _not_ use in performance sensitive code!
+        Returns an iterator over this expression tree (depth-first).
 
         Example::
 
@@ -774,31 +1099,22 @@ class Expression:
             6) Name(x)
 
         To return only expressions of certain types, pass in a sequence
-        ``allowed_typess``, containing all types desired in the output.
+        ``allowed_types``, containing all types desired in the output.
         """
-        if allowed_types is None:
-
-            def walker(op):
-                yield op
-                for kid in op:
-                    for x in walker(kid):
-                        yield x
-            return walker(self)
-
-        else:
-
+        if allowed_types is not None:
             if type(allowed_types) == type:
-                allowed_types = set([allowed_types])
+                allowed_types = frozenset([allowed_types])
             else:
-                allowed_types = set(allowed_types)
-
-            def walker(op):
-                if type(op) in allowed_types:
-                    yield op
-                for kid in op:
-                    for x in walker(kid):
-                        yield x
-            return walker(self)
+                allowed_types = frozenset(allowed_types)
+
+        # Iterative depth-first walk, with the operands pushed in reverse so
+        # that they are visited left to right
+        stack = [self]
+        while stack:
+            op = stack.pop()
+            if allowed_types is None or type(op) in allowed_types:
+                yield op
+            stack.extend(reversed(op._operands))
 
 
 class Number(Expression):
@@ -826,11 +1142,14 @@ class Number(Expression):
 
     *Extends:* :class:`Expression`
     """
+    __slots__ = ('_value', '_unit', '_value32', '_str')
     _rbp = LITERAL
 
     def __init__(self, value, unit=None):
         super().__init__()
-        if isinstance(value, myokit.Quantity):
+        # Floats are checked first, which is quicker for the most common case
+        # and allows numbers to be created before myokit.Quantity is loaded.
+        if type(value) is not float and isinstance(value, myokit.Quantity):
             # Conversion from Quantity class
             if unit is not None:
                 raise ValueError(
@@ -848,26 +1167,10 @@ class Number(Expression):
             else:
                 raise ValueError(
                     'Unit in myokit.Number should be a myokit.Unit or None.')
-        # Create nice string representation
-        self._str = myokit.float.str(self._value)
-        if self._str[-2:] == '.0':
-            # Turn 5.0 into 5
-            self._str = self._str[:-2]
-        elif self._str[-4:-1] == 'e-0':
-            # Turn 1e-05 into 1e-5
-            self._str = self._str[:-2] + self._str[-1]
-        elif self._str[-4:-2] == 'e+':
-            if self._str[-2:] == '00':
-                # Turn 1e+00 into 1
-                self._str = self._str[:-4]
-            elif self._str[-2:-1] == '0':
-                # Turn e+05 into e5
-                self._str = self._str[:-3] + self._str[-1:]
-            else:
-                # Turn e+15 into e15
-                self._str = self._str[:-3] + self._str[-2:]
-        if self._unit and self._unit != myokit.units.dimensionless:
-            self._str += ' ' + str(self._unit)
+        self._value32 = None
+
+        # String representation, created on first use
+        self._str = None
 
     def bracket(self, op=None):
         """See :meth:`Expression.bracket()`."""
@@ -879,10 +1182,11 @@ class Number(Expression):
         """See :meth:`Expression.clone()`."""
         if subst and self in subst:
             return subst[self]
-        return Number(self._value, self._unit)
+        # Numbers are immutable, so there's no need to create a new object
+        return self
 
     def _code(self, b, c):
-        b.write(self._str)
+        b(self._str or self._format())
 
     def convert(self, unit):
         """
@@ -895,16 +1199,54 @@ class Number(Expression):
         return None
 
     def _eval(self, subst, precision):
-        if precision == myokit.SINGLE_PRECISION:
-            return numpy.float32(self._value)
-        else:
+        if precision != myokit.SINGLE_PRECISION:
             return self._value
 
+        # Single precision is mostly used for debugging, so the 32-bit value
+        # is created on first use, and then cached.
+        if self._value32 is None:
+            self._value32 = numpy.float32(self._value)
+        return self._value32
+
+    def _eval_code(self, b, o):
+        v = repr(self._value)
+        if v in ('nan', 'inf', '-inf'):
+            # Can't be written as a Python literal
+            super()._eval_code(b, o)
+        else:
+            b('(' + v + ')' if v[0] == '-' else v)
+
     def _eval_unit(self, mode):
         if mode == myokit.UNIT_STRICT and self._unit is None:
             return myokit.units.dimensionless
         return self._unit
 
+    def _format(self):
+        """
+        Creates, caches, and returns this number's string representation.
+
+        Many numbers are created (e.g. during parsing) without ever being
+        written, so this is only done when first needed.
+        """
+        # Turn 5.0 into 5, 1e-05 into 1e-5, 1e+00 into 1, and 1e+15 into 1e15,
+        # but leave three-digit exponents such as 1e+300 unchanged
+        mantissa, sep, exp = myokit.float.str(self._value).partition('e')
+        if not sep:
+            s = mantissa[:-2] if mantissa.endswith('.0') else mantissa
+        else:
+            exp = int(exp)
+            if exp >= 100:
+                s = f'{mantissa}e+{exp}'
+            else:
+                s = f'{mantissa}e{exp}' if exp else mantissa
+        if self._unit and self._unit != myokit.units.dimensionless:
+            s = f'{s} {self._unit}'
+
+        # Numbers are immutable, so the string can be cached (even if the
+        # Number object is shared between expressions)
+        self._str = s
+        return s
+
     def is_constant(self):
         """See :meth:`Expression.is_constant()`."""
         return True
@@ -917,11 +1259,20 @@ class Number(Expression):
         """See :meth:`Expression.is_number()`."""
         return (value is None) or (value == self._value)
 
+    def _polish(self):
+        # Numbers are written as their string representation, so there is no
+        # need to go via a buffer.
+        return self._str or self._format()
+
     def _polishb(self, b):
-        b.write(self._str)
+        b(self._str or self._format())
+
+    def __str__(self):
+        # Numbers are written the same way in any context
+        return self._str or self._format()
 
     def _tree_str(self, b, n):
-        b.write(' ' * n + self._str + '\n')
+        b(' ' * n + (self._str or self._format()) + '\n')
 
     def unit(self):
         """
@@ -935,6 +1286,13 @@ class Number(Expression):
         return self._value
 
 
+# Numbers used when creating derivatives. Because expressions are immutable,
+# these can be shared instead of creating new objects for every derivative.
+_NUM_ONE = Number(1.0)
+_NUM_TWO = Number(2.0)
+_NUM_TEN = Number(10.0)
+
+
 class LhsExpression(Expression):
     """
     An expression referring to the left-hand side of an equation.
@@ -946,13 +1304,38 @@ class LhsExpression(Expression):
 
     *Abstract class, extends:* :class:`Expression`
     """
+    __slots__ = ()
+
     def _eval(self, subst, precision):
         if subst and self in subst:
             return subst[self].eval()
-        try:
-            return self.rhs()._eval(subst, precision)
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+        rhs = self.rhs()
+        if precision != myokit.SINGLE_PRECISION:
+            # Evaluate the right-hand side with a compiled function, instead
+            # of recursing into it.
+            f = rhs._evaluator()
+            if f is not None:
+                return f(subst, precision)
+        return rhs._eval(subst, precision)
+
+    def _eval_operands(self, subst, precision):
+        # Substituted expressions are evaluated with eval(), which handles
+        # its own errors
+        if not (subst and self in subst):
+            rhs = self.rhs()
+            if rhs is not None:
+                yield rhs
+
+    def _eval_code(self, b, o):
+        # Use a single entry in ``o`` for each reference, so that repeated
+        # references can be recognised by _compile_eval()
+        for k, x in enumerate(o):
+            if x == self:
+                break
+        else:
+            k = len(o)
+            o.append(self)
+        b('_o[' + str(k) + ']._eval(s, p)')
 
     def is_constant(self):
         """See :meth:`Expression.is_constant()`."""
@@ -986,14 +1369,15 @@ class Name(LhsExpression):
 
     *Extends:* :class:`LhsExpression`
     """
+    __slots__ = ('_value', '_proper')
     _rbp = LITERAL
     __hash__ = LhsExpression.__hash__
 
     def __init__(self, value):
         super().__init__()
         self._value = value
-        self._references = set([self])
         self._proper = isinstance(self._value, myokit.Variable)
+        self._references = frozenset([self])
 
     def bracket(self, op=None):
         """See :meth:`Expression.bracket()`."""
@@ -1013,34 +1397,34 @@ class Name(LhsExpression):
                         and self._value.qname() not in retain
                 ):
                     return self._value.rhs().clone(subst, expand, retain)
-        return Name(self._value)
+        return self
 
     def _code(self, b, c):
         if self._proper:
             # Handle proper variable references
             if self._value.is_nested():
-                b.write(self._value.name())
+                b(self._value.name())
             else:
                 if c:
                     try:
-                        b.write(c.alias_for(self._value))
+                        b(c.alias_for(self._value))
                         return
                     except KeyError:
                         pass
-                b.write(self._value.qname(c))
+                b(self._value.qname(c))
         elif isinstance(self._value, str):
             # Allow strings for debugging
-            b.write('str:' + str(self._value))
+            b('str:' + str(self._value))
         else:
             # Allow "misusing" the expression system by storing other types as
             # values.
-            b.write(str(self._value))
+            b(str(self._value))
 
     def _diff(self, lhs, idstates):
 
         # Derivative w.r.t. self is one
         if lhs == self:
-            return Number(1)
+            return _NUM_ONE
 
         # Value isn't a variable? Then always return an object
         if not self._proper:
@@ -1078,6 +1462,8 @@ class Name(LhsExpression):
         return None
 
     def __eq__(self, other):
+        if self is other:
+            return True
         if type(other) != Name:
             return False
         if self._proper:
@@ -1090,6 +1476,12 @@ class Name(LhsExpression):
             # myokit.PrefixPlus(myokit.Name(1.23)).
             return self.code() == other.code()
 
+    def _hash(self):
+        # Proper names are equal if they point to the same variable
+        if self._proper:
+            return hash(id(self._value))
+        return super()._hash()
+
     def is_name(self, var=None):
         """See :meth:`Expression.is_name()`."""
         return (var is None) or (var == self._value)
@@ -1099,17 +1491,17 @@ class Name(LhsExpression):
         return self._proper and self._value.is_state()
 
     def _polishb(self, b):
-        if isinstance(self._value, str):
-            # Allow an exception for strings
-            b.write('str:')
-            b.write(self._value)
-        else:
+        if self._proper or not isinstance(self._value, str):
             # Use object id here to make immutable references. This is fine
             # since references should always be to variable objects, and
             # variables are unique this way (one Variable('x') doesn't equal
             # another Variable('x')).
-            b.write('var:')
-            b.write(str(id(self._value)))
+            b('var:')
+            b(str(id(self._value)))
+        else:
+            # Allow an exception for strings
+            b('str:')
+            b(self._value)
 
     def __repr__(self):
         return '<Name(' + repr(self._value) + ')>'
@@ -1124,7 +1516,7 @@ class Name(LhsExpression):
         return None
 
     def _tree_str(self, b, n):
-        b.write(' ' * n + str(self._value) + '\n')
+        b(' ' * n + str(self._value) + '\n')
 
     def _validate(self, trail):
         super()._validate(trail)
@@ -1146,6 +1538,7 @@ class Derivative(LhsExpression):
 
     *Extends:* :class:`LhsExpression`
     """
+    __slots__ = ('_op', '_proper')
     _rbp = FUNCTION_CALL
     _nargs = [1]    # Allows parsing as a function
     __hash__ = LhsExpression.__hash__
@@ -1158,7 +1551,7 @@ class Derivative(LhsExpression):
                 self._token)
         self._op = op
         self._proper = self._op._proper
-        self._references = set([self])
+        self._references = frozenset([self])
 
     def bracket(self, op):
         """See :meth:`Expression.bracket()`."""
@@ -1168,14 +1561,18 @@ class Derivative(LhsExpression):
 
     def clone(self, subst=None, expand=False, retain=None):
         """See :meth:`Expression.clone()`."""
-        if subst and self in subst:
-            return subst[self]
-        return Derivative(self._op.clone(subst, expand, retain))
+        if subst:
+            if self in subst:
+                return subst[self]
+        elif not expand:
+            return self
+        op = self._op.clone(subst, expand, retain)
+        return self if op is self._op else Derivative(op)
 
     def _code(self, b, c):
-        b.write('dot(')
+        b('dot(')
         self._op._code(b, c)
-        b.write(')')
+        b(')')
 
     def _diff(self, lhs, idstates):
         # Value isn't a variable? Then always return an object
@@ -1223,12 +1620,15 @@ class Derivative(LhsExpression):
             return 1 / unit2
         return unit1 / unit2
 
+    def _hash(self):
+        return hash(('dot', hash(self._op)))
+
     def is_derivative(self, var=None):
         """See :meth:`Expression.is_derivative()`."""
         return (var is None) or (var == self._op._value)
 
     def _polishb(self, b):
-        b.write('dot ')
+        b('dot ')
         self._op._polishb(b)
 
     def __repr__(self):
@@ -1241,7 +1641,7 @@ class Derivative(LhsExpression):
         return None
 
     def _tree_str(self, b, n):
-        b.write(' ' * n + 'dot(' + str(self._op._value) + ')\n')
+        b(' ' * n + 'dot(' + str(self._op._value) + ')\n')
 
     def var(self):
         """See :meth:`LhsExpression.var()`."""
@@ -1267,6 +1667,7 @@ class PartialDerivative(LhsExpression):
 
     *Extends:* :class:`LhsExpression`
     """
+    __slots__ = ('_var1', '_var2')
     _rbp = FUNCTION_CALL
     _nargs = [2]    # Allows parsing as a function
     __hash__ = LhsExpression.__hash__
@@ -1284,7 +1685,7 @@ class PartialDerivative(LhsExpression):
 
         self._var1 = var1
         self._var2 = var2
-        self._references = set([self])
+        self._references = frozenset([self])
         self._has_partials = True
 
     def bracket(self, op=None):
@@ -1295,19 +1696,23 @@ class PartialDerivative(LhsExpression):
 
     def clone(self, subst=None, expand=False, retain=None):
         """See :meth:`Expression.clone()`."""
-        if subst and self in subst:
-            return subst[self]
-        return PartialDerivative(
-            self._var1.clone(subst, expand, retain),
-            self._var2.clone(subst, expand, retain),
-        )
+        if subst:
+            if self in subst:
+                return subst[self]
+        elif not expand:
+            return self
+        var1 = self._var1.clone(subst, expand, retain)
+        var2 = self._var2.clone(subst, expand, retain)
+        if var1 is self._var1 and var2 is self._var2:
+            return self
+        return PartialDerivative(var1, var2)
 
     def _code(self, b, c):
-        b.write('diff(')
+        b('diff(')
         self._var1._code(b, c)
-        b.write(', ')
+        b(', ')
         self._var2._code(b, c)
-        b.write(')')
+        b(')')
 
     def dependent_expression(self):
         """
@@ -1329,6 +1734,9 @@ class PartialDerivative(LhsExpression):
             return 1 / unit2
         return unit1 / unit2
 
+    def _hash(self):
+        return hash(('diff', hash(self._var1), hash(self._var2)))
+
     def independent_expression(self):
         """
         Returns the expression that a derivative is taken with respect to, i.e.
@@ -1337,7 +1745,7 @@ class PartialDerivative(LhsExpression):
         return self._var2
 
     def _polishb(self, b):
-        b.write('diff ')
+        b('diff ')
         self._var1._polishb(b)
         self._var2._polishb(b)
 
@@ -1355,7 +1763,7 @@ class PartialDerivative(LhsExpression):
         return None
 
     def _tree_str(self, b, n):
-        b.write(' ' * n + 'partial\n')
+        b(' ' * n + 'partial\n')
         self._var1._tree_str(b, n + self._treeDent)
         self._var2._tree_str(b, n + self._treeDent)
 
@@ -1375,6 +1783,7 @@ class PrefixExpression(Expression):
 
     *Abstract class, extends:* :class:`Expression`
     """
+    __slots__ = ('_op',)
     _rbp = PREFIX
     _rep = None
 
@@ -1386,28 +1795,35 @@ class PrefixExpression(Expression):
         """See :meth:`Expression.bracket()`."""
         if op != self._op:
             raise ValueError('Given operand is not used in this expression.')
-        return (self._op._rbp > LITERAL) and (self._op._rbp < self._rbp)
+        return LITERAL < self._op._rbp < self._rbp
 
     def clone(self, subst=None, expand=False, retain=None):
         """See :meth:`Expression.clone()`."""
-        if subst and self in subst:
-            return subst[self]
-        return type(self)(self._op.clone(subst, expand, retain))
+        if subst:
+            if self in subst:
+                return subst[self]
+        elif not expand:
+            return self
+        op = self._op.clone(subst, expand, retain)
+        return self if op is self._op else type(self)(op)
 
     def _code(self, b, c):
-        b.write(self._rep)
-        brackets = self._op._rbp > LITERAL and self._op._rbp < self._rbp
+        b(self._rep)
+        brackets = LITERAL < self._op._rbp < self._rbp
         if brackets:
-            b.write('(')
+            b('(')
         self._op._code(b, c)
         if brackets:
-            b.write(')')
+            b(')')
 
     def _eval_unit(self, mode):
         return self._op._eval_unit(mode)
 
+    def _hash(self):
+        return hash((self._rep, hash(self._op)))
+
     def _tree_str(self, b, n):
-        b.write(' ' * n + self._rep + '\n')
+        b(' ' * n + self._rep + '\n')
         self._op._tree_str(b, n + self._treeDent)
 
 
@@ -1422,16 +1838,22 @@ class PrefixPlus(PrefixExpression):
 
     *Extends:* :class:`PrefixExpression`
     """
+    __slots__ = ()
     _rep = '+'
 
     def _diff(self, lhs, idstates):
         return self._op._diff(lhs, idstates)
 
     def _eval(self, subst, precision):
-        try:
-            return self._op._eval(subst, precision)
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+        return self._op._eval(subst, precision)
+
+    def _eval_code(self, b, o):
+        self._op._eval_code(b, o)
+
+    def _hash(self):
+        # Prefix plus doesn't appear in the polish notation, so it can't
+        # affect the hash either
+        return hash(self._op)
 
     def _polishb(self, b):
         self._op._polishb(b)
@@ -1448,23 +1870,38 @@ class PrefixMinus(PrefixExpression):
 
     *Extends:* :class:`PrefixExpression`
     """
+    __slots__ = ()
     _rep = '-'
 
     def _diff(self, lhs, idstates):
         op = self._op._diff(lhs, idstates)
-        return None if op is None else PrefixMinus(op)
+        return None if op is None else _neg(op)
 
     def _eval(self, subst, precision):
-        try:
-            return -self._op._eval(subst, precision)
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+        return -self._op._eval(subst, precision)
+
+    def _eval_code(self, b, o):
+        b('(-')
+        self._op._eval_code(b, o)
+        b(')')
 
     def _polishb(self, b):
-        b.write('~ ')
+        b('~ ')
         self._op._polishb(b)
 
 
+def _neg(e):
+    """
+    Returns ``-e``, cancelling double negations (``--x = x``) and negating
+    numbers directly. Used when creating derivatives.
+    """
+    if isinstance(e, PrefixMinus):
+        return e._op
+    if isinstance(e, Number):
+        return Number(-e._value, e._unit)
+    return PrefixMinus(e)
+
+
 class InfixExpression(Expression):
     """
     Base class for for infix expressions: ``<left> operator <right>``.
@@ -1474,8 +1911,20 @@ class InfixExpression(Expression):
 
     *Abstract class, extends:* :class:`Expression`
     """
+    __slots__ = ('_op1', '_op2')
     _rep = None      # Operator representation (+, *, et)
+    _op_fn = None    # Function implementing the operator (operator.add, etc)
     _spaces_round_operator = True
+    _code_rep = None    # Operator as written by _code(), set automatically
+    _polish_rep = None  # Operator as written by _polishb(), set automatically
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls._rep is not None:
+            cls._code_rep = (
+                ' ' + cls._rep + ' ' if cls._spaces_round_operator
+                else cls._rep)
+            cls._polish_rep = cls._rep + ' '
 
     def __init__(self, left, right):
         super().__init__((left, right))
@@ -1485,48 +1934,63 @@ class InfixExpression(Expression):
     def bracket(self, op):
         """See :meth:`Expression.bracket()`."""
         if op == self._op1:
-            return (op._rbp > LITERAL and (op._rbp < self._rbp))
+            return LITERAL < op._rbp < self._rbp
         elif op == self._op2:
-            return (op._rbp > LITERAL and (op._rbp <= self._rbp))
+            return LITERAL < op._rbp <= self._rbp
         raise ValueError('Given operand is not used in this expression.')
 
     def clone(self, subst=None, expand=False, retain=None):
         """See :meth:`Expression.clone()`."""
-        if subst and self in subst:
-            return subst[self]
-        return type(self)(
-            self._op1.clone(subst, expand, retain),
-            self._op2.clone(subst, expand, retain))
+        if subst:
+            if self in subst:
+                return subst[self]
+        elif not expand:
+            return self
+        op1 = self._op1.clone(subst, expand, retain)
+        op2 = self._op2.clone(subst, expand, retain)
+        if op1 is self._op1 and op2 is self._op2:
+            return self
+        return type(self)(op1, op2)
 
     def _code(self, b, c):
         # Test bracket locally, avoid function call
-        if self._op1._rbp > LITERAL and self._op1._rbp < self._rbp:
-            b.write('(')
+        if LITERAL < self._op1._rbp < self._rbp:
+            b('(')
             self._op1._code(b, c)
-            b.write(')')
+            b(')')
         else:
             self._op1._code(b, c)
-        if self._spaces_round_operator:
-            b.write(' ')
-        b.write(self._rep)
-        if self._spaces_round_operator:
-            b.write(' ')
-        if self._op2._rbp > LITERAL and self._op2._rbp <= self._rbp:
-            b.write('(')
+        b(self._code_rep)
+        if LITERAL < self._op2._rbp <= self._rbp:
+            b('(')
             self._op2._code(b, c)
-            b.write(')')
+            b(')')
         else:
             self._op2._code(b, c)
 
+    def _eval(self, subst, precision):
+        return self._op_fn(
+            self._op1._eval(subst, precision),
+            self._op2._eval(subst, precision))
+
+    def _eval_code(self, b, o):
+        b('(')
+        self._op1._eval_code(b, o)
+        b(' ' + self._rep + ' ')
+        self._op2._eval_code(b, o)
+        b(')')
+
+    def _hash(self):
+        return hash((self._rep, hash(self._op1), hash(self._op2)))
+
     def _polishb(self, b):
-        b.write(self._rep)
-        b.write(' ')
+        b(self._polish_rep)
         self._op1._polishb(b)
-        b.write(' ')
+        b(' ')
         self._op2._polishb(b)
 
     def _tree_str(self, b, n):
-        b.write(' ' * n + self._rep + '\n')
+        b(' ' * n + self._rep + '\n')
         self._op1._tree_str(b, n + self._treeDent)
         self._op2._tree_str(b, n + self._treeDent)
 
@@ -1542,8 +2006,10 @@ class Plus(InfixExpression):
 
     *Extends:* :class:`InfixExpression`
     """
+    __slots__ = ()
     _rbp = SUM
     _rep = '+'
+    _op_fn = operator.add
     _description = 'Addition'
 
     def _diff(self, lhs, idstates):
@@ -1555,14 +2021,6 @@ class Plus(InfixExpression):
             return op1  # Definitely not None
         return Plus(op1, op2)
 
-    def _eval(self, subst, precision):
-        try:
-            return (
-                self._op1._eval(subst, precision)
-                + self._op2._eval(subst, precision))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
-
     def _eval_unit(self, mode):
         unit1 = self._op1._eval_unit(mode)
         unit2 = self._op2._eval_unit(mode)
@@ -1590,8 +2048,10 @@ class Minus(InfixExpression):
 
     *Extends:* :class:`InfixExpression`
     """
+    __slots__ = ()
     _rbp = SUM
     _rep = '-'
+    _op_fn = operator.sub
     _description = 'Subtraction'
 
     def _diff(self, lhs, idstates):
@@ -1601,17 +2061,9 @@ class Minus(InfixExpression):
             return op1  # Could be None
         if op1 is None:
             # Op2 is not None, so need to return -op2
-            return PrefixMinus(op2)
+            return _neg(op2)
         return Minus(op1, op2)
 
-    def _eval(self, subst, precision):
-        try:
-            return (
-                self._op1._eval(subst, precision)
-                - self._op2._eval(subst, precision))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
-
     def _eval_unit(self, mode):
         unit1 = self._op1._eval_unit(mode)
         unit2 = self._op2._eval_unit(mode)
@@ -1639,8 +2091,10 @@ class Multiply(InfixExpression):
 
     *Extends:* :class:`InfixExpression`
     """
+    __slots__ = ()
     _rbp = PRODUCT
     _rep = '*'
+    _op_fn = operator.mul
 
     def _diff(self, lhs, idstates):
         op1 = self._op1._diff(lhs, idstates)
@@ -1653,14 +2107,6 @@ class Multiply(InfixExpression):
             return Multiply(self._op1, op2)     # f g'
         return Plus(Multiply(op1, self._op2), Multiply(self._op1, op2))
 
-    def _eval(self, subst, precision):
-        try:
-            return (
-                self._op1._eval(subst, precision)
-                * self._op2._eval(subst, precision))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
-
     def _eval_unit(self, mode):
         unit1 = self._op1._eval_unit(mode)
         unit2 = self._op2._eval_unit(mode)
@@ -1684,6 +2130,7 @@ class Divide(InfixExpression):
 
     *Extends:* :class:`InfixExpression`
     """
+    __slots__ = ()
     _rbp = PRODUCT
     _rep = '/'
 
@@ -1699,24 +2146,42 @@ class Divide(InfixExpression):
         elif op1 is None:
             # -(f g') / g^2
             return Divide(
-                Multiply(PrefixMinus(self._op1), op2),
-                Power(self._op2, Number(2))
+                Multiply(_neg(self._op1), op2),
+                Power(self._op2, _NUM_TWO)
             )
 
         # (f' g - f g') / g^2
         return Divide(
             Minus(Multiply(op1, self._op2), Multiply(self._op1, op2)),
-            Power(self._op2, Number(2))
+            Power(self._op2, _NUM_TWO)
         )
 
     def _eval(self, subst, precision):
-        try:
-            b = self._op2._eval(subst, precision)
-            if b == 0:
-                raise ZeroDivisionError()
-            return self._op1._eval(subst, precision) / b
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+        b = self._op2._eval(subst, precision)
+        if b == 0:
+            raise ZeroDivisionError()
+        return self._op1._eval(subst, precision) / b
+
+    def _eval_operands(self, subst, precision):
+        # The numerator is not evaluated when dividing by zero
+        yield self._op2
+        if self._op2._eval(subst, precision) != 0:
+            yield self._op1
+
+    def _eval_code(self, b, o):
+        if isinstance(self._op2, Number) and self._op2._value != 0:
+            # No need to check for zero when dividing by a non-zero constant
+            b('(')
+            self._op1._eval_code(b, o)
+            b(' / ')
+            self._op2._eval_code(b, o)
+            b(')')
+        else:
+            b('_divide(')
+            self._op1._eval_code(b, o)
+            b(', ')
+            self._op2._eval_code(b, o)
+            b(')')
 
     def _eval_unit(self, mode):
         unit1 = self._op1._eval_unit(mode)
@@ -1760,8 +2225,10 @@ class Quotient(InfixExpression):
 
     *Extends:* :class:`InfixExpression`
     """
+    __slots__ = ()
     _rbp = PRODUCT
     _rep = '//'
+    _op_fn = operator.floordiv
 
     def _diff(self, lhs, idstates):
         # The result of a // b is always flat, with discontinuous jumps
@@ -1776,14 +2243,6 @@ class Quotient(InfixExpression):
         # derivative, and simply return zero for all points.
         return None
 
-    def _eval(self, subst, precision):
-        try:
-            return (
-                self._op1._eval(subst, precision)
-                // self._op2._eval(subst, precision))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
-
     def _eval_unit(self, mode):
         unit1 = self._op1._eval_unit(mode)
         unit2 = self._op2._eval_unit(mode)
@@ -1831,8 +2290,10 @@ class Remainder(InfixExpression):
 
     *Extends:* :class:`InfixExpression`
     """
+    __slots__ = ()
     _rbp = PRODUCT
     _rep = '%'
+    _op_fn = operator.mod
 
     def _diff(self, lhs, idstates):
         # Since
@@ -1851,7 +2312,7 @@ class Remainder(InfixExpression):
         elif op1 is None:
             # -b' floor(a/b)
             return Multiply(
-                PrefixMinus(op2), Floor(Divide(self._op1, self._op2)))
+                _neg(op2), Floor(Divide(self._op1, self._op2)))
         elif op2 is None:
             # a'
             return op1
@@ -1859,14 +2320,6 @@ class Remainder(InfixExpression):
         # a' - b' floor(a/b)
         return Minus(op1, Multiply(op2, Floor(Divide(self._op1, self._op2))))
 
-    def _eval(self, subst, precision):
-        try:
-            return (
-                self._op1._eval(subst, precision)
-                % self._op2._eval(subst, precision))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
-
     def _eval_unit(self, mode):
         # 14 pizzas / 5 kids = 2 pizzas / kid + 4 pizzas
         unit1 = self._op1._eval_unit(mode)
@@ -1885,8 +2338,10 @@ class Power(InfixExpression):
 
     *Extends:* :class:`InfixExpression`
     """
+    __slots__ = ()
     _rbp = POWER
     _rep = '^'
+    _op_fn = operator.pow
     _spaces_round_operator = False
 
     def _diff(self, lhs, idstates):
@@ -1925,7 +2380,7 @@ class Power(InfixExpression):
                     new_power = Number(self._op2.value() - 1, self._op2.unit())
                     new_power = Power(self._op1, new_power)
             else:
-                new_power = Power(self._op1, Minus(self._op2, Number(1)))
+                new_power = Power(self._op1, Minus(self._op2, _NUM_ONE))
             return Multiply(Multiply(self._op2, new_power), op1)
 
         if op1 is None:
@@ -1936,13 +2391,12 @@ class Power(InfixExpression):
             Multiply(Divide(self._op2, self._op1), op1)
         ))
 
-    def _eval(self, subst, precision):
-        try:
-            return (
-                self._op1._eval(subst, precision)
-                ** self._op2._eval(subst, precision))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+    def _eval_code(self, b, o):
+        b('(')
+        self._op1._eval_code(b, o)
+        b(' ** ')
+        self._op2._eval_code(b, o)
+        b(')')
 
     def _eval_unit(self, mode):
         unit1 = self._op1._eval_unit(mode)
@@ -1976,6 +2430,7 @@ class Function(Expression):
 
     *Abstract class, extends:* :class:`Expression`
     """
+    __slots__ = ()
     _nargs = [1]
     _fname = None
     _rbp = FUNCTION_CALL
@@ -1998,33 +2453,41 @@ class Function(Expression):
 
     def clone(self, subst=None, expand=False, retain=None):
         """See :meth:`Expression.clone()`."""
-        if subst and self in subst:
-            return subst[self]
-        return type(self)(
-            *[x.clone(subst, expand, retain) for x in self._operands])
+        if subst:
+            if self in subst:
+                return subst[self]
+        elif not expand:
+            return self
+        ops = [x.clone(subst, expand, retain) for x in self._operands]
+        for x, y in zip(ops, self._operands):
+            if x is not y:
+                return type(self)(*ops)
+        return self
 
     def _code(self, b, c):
-        b.write(self._fname)
-        b.write('(')
-        if len(self._operands) > 0:
-            self._operands[0]._code(b, c)
-            for i in range(1, len(self._operands)):
-                b.write(', ')
-                self._operands[i]._code(b, c)
-        b.write(')')
+        b(self._fname)
+        b('(')
+        for i, op in enumerate(self._operands):
+            if i:
+                b(', ')
+            op._code(b, c)
+        b(')')
+
+    def _hash(self):
+        return hash((self._fname, *[hash(op) for op in self._operands]))
 
     def _polishb(self, b):
         # Function name | Number of operands | operands
         # This is sufficient for what we're doing here :)
-        b.write(self._fname)
-        b.write(' ')
-        b.write(str(len(self._operands)))
+        b(self._fname)
+        b(' ')
+        b(str(len(self._operands)))
         for op in self._operands:
-            b.write(' ')
+            b(' ')
             op._polishb(b)
 
     def _tree_str(self, b, n):
-        b.write(' ' * n + self._fname + '\n')
+        b(' ' * n + self._fname + '\n')
         for op in self._operands:
             op._tree_str(b, n + self._treeDent)
 
@@ -2035,6 +2498,8 @@ class UnaryDimensionlessFunction(Function):
 
     *Abstract class, extends:* :class:`Function`
     """
+    __slots__ = ()
+
     def _eval_unit(self, mode):
         unit = self._operands[0]._eval_unit(mode)
 
@@ -2063,6 +2528,7 @@ class Sqrt(Function):
 
     *Extends:* :class:`Function`
     """
+    __slots__ = ()
     _fname = 'sqrt'
 
     def _diff(self, lhs, idstates):
@@ -2070,13 +2536,15 @@ class Sqrt(Function):
         dop = op._diff(lhs, idstates)
         if dop is None:
             return None
-        return Divide(dop, Multiply(Number(2), self))
+        return Divide(dop, Multiply(_NUM_TWO, self))
 
     def _eval(self, subst, precision):
-        try:
-            return numpy.sqrt(self._operands[0]._eval(subst, precision))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+        return _sqrt(self._operands[0]._eval(subst, precision))
+
+    def _eval_code(self, b, o):
+        b('_sqrt(')
+        self._operands[0]._eval_code(b, o)
+        b(')')
 
     def _eval_unit(self, mode):
         unit = self._operands[0]._eval_unit(mode)
@@ -2099,6 +2567,7 @@ class Sin(UnaryDimensionlessFunction):
 
     *Extends:* :class:`UnaryDimensionlessFunction`
     """
+    __slots__ = ()
     _fname = 'sin'
 
     def _diff(self, lhs, idstates):
@@ -2109,10 +2578,12 @@ class Sin(UnaryDimensionlessFunction):
         return Multiply(Cos(op), dop)
 
     def _eval(self, subst, precision):
-        try:
-            return numpy.sin(self._operands[0]._eval(subst, precision))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+        return _sin(self._operands[0]._eval(subst, precision))
+
+    def _eval_code(self, b, o):
+        b('_sin(')
+        self._operands[0]._eval_code(b, o)
+        b(')')
 
 
 class Cos(UnaryDimensionlessFunction):
@@ -2129,6 +2600,7 @@ class Cos(UnaryDimensionlessFunction):
 
     *Extends:* :class:`UnaryDimensionlessFunction`
     """
+    __slots__ = ()
     _fname = 'cos'
 
     def _diff(self, lhs, idstates):
@@ -2139,10 +2611,12 @@ class Cos(UnaryDimensionlessFunction):
         return Multiply(PrefixMinus(Sin(op)), dop)
 
     def _eval(self, subst, precision):
-        try:
-            return numpy.cos(self._operands[0]._eval(subst, precision))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+        return _cos(self._operands[0]._eval(subst, precision))
+
+    def _eval_code(self, b, o):
+        b('_cos(')
+        self._operands[0]._eval_code(b, o)
+        b(')')
 
 
 class Tan(UnaryDimensionlessFunction):
@@ -2156,6 +2630,7 @@ class Tan(UnaryDimensionlessFunction):
 
     *Extends:* :class:`UnaryDimensionlessFunction`
     """
+    __slots__ = ()
     _fname = 'tan'
 
     def _diff(self, lhs, idstates):
@@ -2163,13 +2638,15 @@ class Tan(UnaryDimensionlessFunction):
         dop = op._diff(lhs, idstates)
         if dop is None:
             return None
-        return Divide(dop, Power(Cos(op), Number(2)))
+        return Divide(dop, Power(Cos(op), _NUM_TWO))
 
     def _eval(self, subst, precision):
-        try:
-            return numpy.tan(self._operands[0]._eval(subst, precision))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+        return _tan(self._operands[0]._eval(subst, precision))
+
+    def _eval_code(self, b, o):
+        b('_tan(')
+        self._operands[0]._eval_code(b, o)
+        b(')')
 
 
 class ASin(UnaryDimensionlessFunction):
@@ -2183,6 +2660,7 @@ class ASin(UnaryDimensionlessFunction):
 
     *Extends:* :class:`UnaryDimensionlessFunction`
     """
+    __slots__ = ()
     _fname = 'asin'
 
     def _diff(self, lhs, idstates):
@@ -2190,13 +2668,15 @@ class ASin(UnaryDimensionlessFunction):
         dop = op._diff(lhs, idstates)
         if dop is None:
             return None
-        return Divide(dop, Sqrt(Minus(Number(1), Power(op, Number(2)))))
+        return Divide(dop, Sqrt(Minus(_NUM_ONE, Power(op, _NUM_TWO))))
 
     def _eval(self, subst, precision):
-        try:
-            return numpy.arcsin(self._operands[0]._eval(subst, precision))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+        return _asin(self._operands[0]._eval(subst, precision))
+
+    def _eval_code(self, b, o):
+        b('_asin(')
+        self._operands[0]._eval_code(b, o)
+        b(')')
 
 
 class ACos(UnaryDimensionlessFunction):
@@ -2210,6 +2690,7 @@ class ACos(UnaryDimensionlessFunction):
 
     *Extends:* :class:`UnaryDimensionlessFunction`
     """
+    __slots__ = ()
     _fname = 'acos'
 
     def _diff(self, lhs, idstates):
@@ -2218,15 +2699,17 @@ class ACos(UnaryDimensionlessFunction):
         if dop is None:
             return None
         return Divide(
-            PrefixMinus(dop),
-            Sqrt(Minus(Number(1), Power(op, Number(2))))
+            _neg(dop),
+            Sqrt(Minus(_NUM_ONE, Power(op, _NUM_TWO)))
         )
 
     def _eval(self, subst, precision):
-        try:
-            return numpy.arccos(self._operands[0]._eval(subst, precision))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+        return _acos(self._operands[0]._eval(subst, precision))
+
+    def _eval_code(self, b, o):
+        b('_acos(')
+        self._operands[0]._eval_code(b, o)
+        b(')')
 
 
 class ATan(UnaryDimensionlessFunction):
@@ -2245,6 +2728,7 @@ class ATan(UnaryDimensionlessFunction):
 
     *Extends:* :class:`UnaryDimensionlessFunction`
     """
+    __slots__ = ()
     _fname = 'atan'
 
     def _diff(self, lhs, idstates):
@@ -2252,13 +2736,15 @@ class ATan(UnaryDimensionlessFunction):
         dop = op._diff(lhs, idstates)
         if dop is None:
             return None
-        return Divide(dop, Plus(Number(1), Power(op, Number(2))))
+        return Divide(dop, Plus(_NUM_ONE, Power(op, _NUM_TWO)))
 
     def _eval(self, subst, precision):
-        try:
-            return numpy.arctan(self._operands[0]._eval(subst, precision))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+        return _atan(self._operands[0]._eval(subst, precision))
+
+    def _eval_code(self, b, o):
+        b('_atan(')
+        self._operands[0]._eval_code(b, o)
+        b(')')
 
 
 class Exp(UnaryDimensionlessFunction):
@@ -2272,6 +2758,7 @@ class Exp(UnaryDimensionlessFunction):
 
     *Extends:* :class:`UnaryDimensionlessFunction`
     """
+    __slots__ = ()
     _fname = 'exp'
 
     def _diff(self, lhs, idstates):
@@ -2282,10 +2769,12 @@ class Exp(UnaryDimensionlessFunction):
         return Multiply(self, dop)
 
     def _eval(self, subst, precision):
-        try:
-            return numpy.exp(self._operands[0]._eval(subst, precision))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+        return _exp(self._operands[0]._eval(subst, precision))
+
+    def _eval_code(self, b, o):
+        b('_exp(')
+        self._operands[0]._eval_code(b, o)
+        b(')')
 
 
 class Log(Function):
@@ -2307,6 +2796,7 @@ class Log(Function):
 
     *Extends:* :class:`Function`
     """
+    __slots__ = ()
     _fname = 'log'
     _nargs = [1, 2]
 
@@ -2335,29 +2825,41 @@ class Log(Function):
             elif dop1 is None:
                 # b' = 0 --> -a' ln(b) / (a ln(a)^2)
                 return Divide(
-                    Multiply(PrefixMinus(dop2), Log(op1)),
-                    Multiply(op2, Power(Log(op2), Number(2))),
+                    Multiply(_neg(dop2), Log(op1)),
+                    Multiply(op2, Power(Log(op2), _NUM_TWO)),
                 )
 
             # Full form:
             #   b' / (b * ln(a)) - (a' ln(b)) / (a ln(a)^2)
+            # Expressions are immutable, so ln(a) can be shared between both
+            # terms.
+            ln_a = Log(op2)
             return Minus(
-                Divide(dop1, Multiply(op1, Log(op2))),
+                Divide(dop1, Multiply(op1, ln_a)),
                 Divide(
                     Multiply(dop2, Log(op1)),
-                    Multiply(op2, Power(Log(op2), Number(2))),
+                    Multiply(op2, Power(ln_a, _NUM_TWO)),
                 )
             )
 
     def _eval(self, subst, precision):
-        try:
-            if len(self._operands) == 1:
-                return numpy.log(self._operands[0]._eval(subst, precision))
-            return (
-                numpy.log(self._operands[0]._eval(subst, precision)) /
-                numpy.log(self._operands[1]._eval(subst, precision)))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+        if len(self._operands) == 1:
+            return _log(self._operands[0]._eval(subst, precision))
+        return (
+            _log(self._operands[0]._eval(subst, precision)) /
+            _log(self._operands[1]._eval(subst, precision)))
+
+    def _eval_code(self, b, o):
+        if len(self._operands) == 1:
+            b('_log(')
+            self._operands[0]._eval_code(b, o)
+            b(')')
+        else:
+            b('(_log(')
+            self._operands[0]._eval_code(b, o)
+            b(') / _log(')
+            self._operands[1]._eval_code(b, o)
+            b('))')
 
     def _eval_unit(self, mode):
 
@@ -2397,6 +2899,10 @@ class Log(Function):
         return myokit.units.dimensionless
 
 
+# The natural logarithm of 10, shared by all Log10 derivatives
+_LOG_TEN = Log(_NUM_TEN)
+
+
 class Log10(UnaryDimensionlessFunction):
     """
     Represents the base-10 logarithm ``log10(x)``.
@@ -2408,6 +2914,7 @@ class Log10(UnaryDimensionlessFunction):
 
     *Extends:* :class:`UnaryDimensionlessFunction`
     """
+    __slots__ = ()
     _fname = 'log10'
 
     def _diff(self, lhs, idstates):
@@ -2415,13 +2922,15 @@ class Log10(UnaryDimensionlessFunction):
         dop = op._diff(lhs, idstates)
         if dop is None:
             return None
-        return Divide(dop, Multiply(op, Log(Number(10))))
+        return Divide(dop, Multiply(op, _LOG_TEN))
 
     def _eval(self, subst, precision):
-        try:
-            return numpy.log10(self._operands[0]._eval(subst, precision))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+        return _log10(self._operands[0]._eval(subst, precision))
+
+    def _eval_code(self, b, o):
+        b('_log10(')
+        self._operands[0]._eval_code(b, o)
+        b(')')
 
 
 class Floor(Function):
@@ -2438,6 +2947,7 @@ class Floor(Function):
 
     *Extends:* :class:`Function`
     """
+    __slots__ = ()
     _fname = 'floor'
 
     def _diff(self, lhs, idstates):
@@ -2447,10 +2957,12 @@ class Floor(Function):
         return None
 
     def _eval(self, subst, precision):
-        try:
-            return numpy.floor(self._operands[0]._eval(subst, precision))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+        return _floor(self._operands[0]._eval(subst, precision))
+
+    def _eval_code(self, b, o):
+        b('_floor(')
+        self._operands[0]._eval_code(b, o)
+        b(')')
 
     def _eval_unit(self, mode):
         return self._operands[0]._eval_unit(mode)
@@ -2470,6 +2982,7 @@ class Ceil(Function):
 
     *Extends:* :class:`Function`
     """
+    __slots__ = ()
     _fname = 'ceil'
 
     def _diff(self, lhs, idstates):
@@ -2479,10 +2992,12 @@ class Ceil(Function):
         return None
 
     def _eval(self, subst, precision):
-        try:
-            return numpy.ceil(self._operands[0]._eval(subst, precision))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+        return _ceil(self._operands[0]._eval(subst, precision))
+
+    def _eval_code(self, b, o):
+        b('_ceil(')
+        self._operands[0]._eval_code(b, o)
+        b(')')
 
     def _eval_unit(self, mode):
         return self._operands[0]._eval_unit(mode)
@@ -2502,6 +3017,7 @@ class Abs(Function):
 
     *Extends:* :class:`Function`
     """
+    __slots__ = ()
     _fname = 'abs'
 
     def _diff(self, lhs, idstates):
@@ -2521,13 +3037,16 @@ class Abs(Function):
             unit = None
 
         # Return if
-        return If(MoreEqual(op, Number(0, unit)), dop, PrefixMinus(dop))
+        return If(MoreEqual(op, Number(0, unit)), dop, _neg(dop))
 
     def _eval(self, subst, precision):
-        try:
-            return numpy.abs(self._operands[0]._eval(subst, precision))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+        # Uses the builtin abs() for floats, which is exact, like numpy.abs
+        return _abs(self._operands[0]._eval(subst, precision))
+
+    def _eval_code(self, b, o):
+        b('_abs(')
+        self._operands[0]._eval_code(b, o)
+        b(')')
 
     def _eval_unit(self, mode):
         return self._operands[0]._eval_unit(mode)
@@ -2548,6 +3067,7 @@ class If(Function):
 
     *Extends:* :class:`Function`
     """
+    __slots__ = ('_i', '_t', '_e')
     _nargs = [3]
     _fname = 'if'
 
@@ -2585,6 +3105,19 @@ class If(Function):
             return self._t._eval(subst, precision)
         return self._e._eval(subst, precision)
 
+    def _eval_operands(self, subst, precision):
+        yield self._i
+        yield self._t if self._i._eval(subst, precision) else self._e
+
+    def _eval_code(self, b, o):
+        b('(')
+        self._t._eval_code(b, o)
+        b(' if ')
+        self._i._eval_code(b, o)
+        b(' else ')
+        self._e._eval_code(b, o)
+        b(')')
+
     def _eval_unit(self, mode):
 
         # Check the condition and all options
@@ -2654,6 +3187,7 @@ class Piecewise(Function):
 
     *Extends:* :class:`Function`
     """
+    __slots__ = ('_i', '_e')
     _nargs = None
     _fname = 'piecewise'
 
@@ -2671,15 +3205,10 @@ class Piecewise(Function):
                 'Piecewise function must have 3 or more arguments.',
                 self._token)
 
-        # Check arguments
-        m = n // 2
-        self._i = [0] * m           # Conditions
-        self._e = [0] * (m + 1)     # Expressions
-        oper = iter(ops)
-        for i in range(0, m):
-            self._i[i] = next(oper)
-            self._e[i] = next(oper)
-        self._e[m] = next(oper)
+        # Split into conditions and expressions
+        ops = self._operands
+        self._i = list(ops[0:-1:2])             # Conditions
+        self._e = list(ops[1::2]) + [ops[-1]]   # Expressions
 
     def conditions(self):
         """
@@ -2692,24 +3221,21 @@ class Piecewise(Function):
         # Evaluate derivatives of the (m + 1) expressions
         ops = [op._diff(lhs, idstates) for op in self._e]
 
-        # Count the number of Nones
-        n_zeroes = sum([1 if op is None else 0 for op in ops])
-
         # Return None if all None
-        if n_zeroes == len(ops):
+        n_none = ops.count(None)
+        if n_none == len(ops):
             return None
 
-        # Create zero to use if any of the expressions are None
-        zero = None
-        if n_zeroes > 0:
+        # Replace any Nones with zero
+        if n_none:
             zero = Number(0, self._diff_unit(lhs))
+            ops = [zero if op is None else op for op in ops]
 
-        # Create and return piecewise
-        new_ops = [0] * (2 * len(self._i) + 1)
-        for i, _if in enumerate(self._i):
-            new_ops[2 * i] = _if
-            new_ops[2 * i + 1] = zero if ops[i] is None else ops[i]
-        new_ops[-1] = zero if ops[-1] is None else ops[-1]
+        # Create and return piecewise, re-using the conditions
+        new_ops = [None] * (2 * len(ops) - 1)
+        new_ops[0:-1:2] = self._i
+        new_ops[1::2] = ops[:-1]
+        new_ops[-1] = ops[-1]
         return Piecewise(*new_ops)
 
     def _eval(self, subst, precision):
@@ -2718,23 +3244,43 @@ class Piecewise(Function):
                 return self._e[k]._eval(subst, precision)
         return self._e[-1]._eval(subst, precision)
 
+    def _eval_operands(self, subst, precision):
+        for k, cond in enumerate(self._i):
+            yield cond
+            if cond._eval(subst, precision):
+                yield self._e[k]
+                return
+        yield self._e[-1]
+
+    def _eval_code(self, b, o):
+        for k, cond in enumerate(self._i):
+            b('(')
+            self._e[k]._eval_code(b, o)
+            b(' if ')
+            cond._eval_code(b, o)
+            b(' else ')
+        self._e[-1]._eval_code(b, o)
+        b(')' * len(self._i))
+
     def _eval_unit(self, mode):
 
-        # Check the conditions and all options
-        units = [x._eval_unit(mode) for x in self._i]   # And discard :)
-        units = [x._eval_unit(mode) for x in self._e]
+        # Check the conditions
+        for x in self._i:
+            x._eval_unit(mode)
 
         # Check if the options have the same unit
-        units = set(units)
         # Nones are allowed in tolerant mode, can't occur in strict mode
-        if None in units:
-            units.remove(None)
-            if len(units) == 0:
-                return None
-        if len(units) == 1:
-            return units.pop()
-        raise EvalUnitError(
-            self, 'All branches of a piecewise() must have the same unit.')
+        unit = None
+        for x in self._e:
+            u = x._eval_unit(mode)
+            if u is not None:
+                if unit is None:
+                    unit = u
+                elif u != unit:
+                    raise EvalUnitError(
+                        self, 'All branches of a piecewise() must have the'
+                        ' same unit.')
+        return unit
 
     def is_conditional(self):
         return True
@@ -2754,6 +3300,7 @@ class Condition:
     False. Doesn't add any methods but simply indicates that this is a
     condition.
     """
+    __slots__ = ()
 
     def _diff(self, lhs, idstates):
         raise NotImplementedError(
@@ -2766,6 +3313,7 @@ class PrefixCondition(PrefixExpression, Condition):
 
     *Abstract class, extends:* :class:`Condition`, :class:`PrefixExpression`
     """
+    __slots__ = ()
 
 
 class Not(PrefixCondition):
@@ -2785,22 +3333,25 @@ class Not(PrefixCondition):
 
     *Extends:* :class:`PrefixCondition`
     """
+    __slots__ = ()
     _rep = 'not'
 
     def _code(self, b, c):
-        b.write('not ')
-        brackets = self._op._rbp > LITERAL and self._op._rbp < self._rbp
+        b('not ')
+        brackets = LITERAL < self._op._rbp < self._rbp
         if brackets:
-            b.write('(')
+            b('(')
         self._op._code(b, c)
         if brackets:
-            b.write(')')
+            b(')')
 
     def _eval(self, subst, precision):
-        try:
-            return not self._op._eval(subst, precision)
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+        return not self._op._eval(subst, precision)
+
+    def _eval_code(self, b, o):
+        b('(not ')
+        self._op._eval_code(b, o)
+        b(')')
 
     def _eval_unit(self, mode):
         unit = self._op._eval_unit(mode)
@@ -2810,7 +3361,7 @@ class Not(PrefixCondition):
         return unit
 
     def _polishb(self, b):
-        b.write('not ')
+        b('not ')
         self._op._polishb(b)
 
 
@@ -2820,8 +3371,33 @@ class InfixCondition(InfixExpression, Condition):
 
     *Abstract class, extends:* :class:`Condition`, :class:`InfixExpression`
     """
+    __slots__ = ()
     _rbp = CONDITIONAL
 
+    def _eval_code(self, b, o):
+        # Conditions without references, e.g. ``1 == 1``, are evaluated just
+        # once, when compiling.
+        v = _literal_condition(self)
+        if v is None:
+            super()._eval_code(b, o)
+        else:
+            b(str(v))
+
+
+def _literal_condition(e):
+    """
+    Returns the value (``True`` or ``False``) of a condition ``e`` that does
+    not contain any references, or ``None`` if ``e`` has references, is not a
+    condition, or can't be evaluated. Used by ``_eval_code()``.
+    """
+    if e._references or not isinstance(e, Condition):
+        return None
+    try:
+        v = e._eval(None, myokit.DOUBLE_PRECISION)
+    except (ArithmeticError, ValueError):
+        return None
+    return v if type(v) is bool else None
+
 
 class BinaryComparison(InfixCondition):
     """
@@ -2829,6 +3405,8 @@ class BinaryComparison(InfixCondition):
 
     *Abstract class, extends:* :class:`InfixCondition`
     """
+    __slots__ = ()
+
     def _eval_unit(self, mode):
         unit1 = self._op1._eval_unit(mode)
         unit2 = self._op2._eval_unit(mode)
@@ -2859,15 +3437,9 @@ class Equal(BinaryComparison):
 
     *Extends:* :class:`InfixCondition`
     """
+    __slots__ = ()
     _rep = '=='
-
-    def _eval(self, subst, precision):
-        try:
-            return (
-                self._op1._eval(subst, precision)
-                == self._op2._eval(subst, precision))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+    _op_fn = operator.eq
 
 
 class NotEqual(BinaryComparison):
@@ -2882,15 +3454,9 @@ class NotEqual(BinaryComparison):
 
     *Extends:* :class:`InfixCondition`
     """
+    __slots__ = ()
     _rep = '!='
-
-    def _eval(self, subst, precision):
-        try:
-            return (
-                self._op1._eval(subst, precision)
-                != self._op2._eval(subst, precision))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+    _op_fn = operator.ne
 
 
 class More(BinaryComparison):
@@ -2903,15 +3469,9 @@ class More(BinaryComparison):
 
     *Extends:* :class:`InfixCondition`
     """
+    __slots__ = ()
     _rep = '>'
-
-    def _eval(self, subst, precision):
-        try:
-            return (
-                self._op1._eval(subst, precision)
-                > self._op2._eval(subst, precision))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+    _op_fn = operator.gt
 
 
 class Less(BinaryComparison):
@@ -2924,15 +3484,9 @@ class Less(BinaryComparison):
 
     *Extends:* :class:`InfixCondition`
     """
+    __slots__ = ()
     _rep = '<'
-
-    def _eval(self, subst, precision):
-        try:
-            return (
-                self._op1._eval(subst, precision)
-                < self._op2._eval(subst, precision))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+    _op_fn = operator.lt
 
 
 class MoreEqual(BinaryComparison):
@@ -2945,15 +3499,9 @@ class MoreEqual(BinaryComparison):
 
     *Extends:* :class:`InfixCondition`
     """
+    __slots__ = ()
     _rep = '>='
-
-    def _eval(self, subst, precision):
-        try:
-            return (
-                self._op1._eval(subst, precision)
-                >= self._op2._eval(subst, precision))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+    _op_fn = operator.ge
 
 
 class LessEqual(BinaryComparison):
@@ -2966,15 +3514,9 @@ class LessEqual(BinaryComparison):
 
     *Extends:* :class:`InfixCondition`
     """
+    __slots__ = ()
     _rep = '<='
-
-    def _eval(self, subst, precision):
-        try:
-            return (
-                self._op1._eval(subst, precision)
-                <= self._op2._eval(subst, precision))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+    _op_fn = operator.le
 
 
 class And(InfixCondition):
@@ -2989,16 +3531,29 @@ class And(InfixCondition):
 
     *Extends:* :class:`InfixCondition`
     """
+    __slots__ = ()
     _rbp = CONDITION_AND
     _rep = 'and'
 
     def _eval(self, subst, precision):
-        try:
-            return (
-                self._op1._eval(subst, precision)
-                and self._op2._eval(subst, precision))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+        return (
+            self._op1._eval(subst, precision)
+            and self._op2._eval(subst, precision))
+
+    def _eval_operands(self, subst, precision):
+        yield self._op1
+        if self._op1._eval(subst, precision):
+            yield self._op2
+
+    def _eval_code(self, b, o):
+        # Drop literal first operands, e.g. in ``1 == 1 and x > 0``
+        v = _literal_condition(self._op1)
+        if v is None:
+            super()._eval_code(b, o)
+        elif v:
+            self._op2._eval_code(b, o)
+        else:
+            b('False')
 
     def _eval_unit(self, mode):
         unit1 = self._op1._eval_unit(mode)
@@ -3009,10 +3564,9 @@ class And(InfixCondition):
             return None
 
         # Ideal: both dimensionless
-        unit1 = myokit.units.dimensionless if unit1 is None else unit1
-        unit2 = myokit.units.dimensionless if unit2 is None else unit2
-        if unit1 == unit2 == myokit.units.dimensionless:
-            return unit1
+        d = myokit.units.dimensionless
+        if (unit1 is None or unit1 == d) and (unit2 is None or unit2 == d):
+            return d
 
         raise EvalUnitError(
             self, 'Operator `and` expects dimensionless operands.')
@@ -3028,16 +3582,29 @@ class Or(InfixCondition):
 
     *Extends:* :class:`InfixCondition`
     """
+    __slots__ = ()
     _rbp = CONDITION_AND
     _rep = 'or'
 
     def _eval(self, subst, precision):
-        try:
-            return (
-                self._op1._eval(subst, precision)
-                or self._op2._eval(subst, precision))
-        except (ArithmeticError, ValueError) as e:  # pragma: no cover
-            raise EvalError(self, subst, e)
+        return (
+            self._op1._eval(subst, precision)
+            or self._op2._eval(subst, precision))
+
+    def _eval_operands(self, subst, precision):
+        yield self._op1
+        if not self._op1._eval(subst, precision):
+            yield self._op2
+
+    def _eval_code(self, b, o):
+        # Drop literal first operands, e.g. in ``1 == 2 or x > 0``
+        v = _literal_condition(self._op1)
+        if v is None:
+            super()._eval_code(b, o)
+        elif v:
+            b('True')
+        else:
+            self._op2._eval_code(b, o)
 
     def _eval_unit(self, mode):
         unit1 = self._op1._eval_unit(mode)
@@ -3048,10 +3615,9 @@ class Or(InfixCondition):
             return None
 
         # Ideal: both dimensionless
-        unit1 = myokit.units.dimensionless if unit1 is None else unit1
-        unit2 = myokit.units.dimensionless if unit2 is None else unit2
-        if unit1 == unit2 == myokit.units.dimensionless:
-            return unit1
+        d = myokit.units.dimensionless
+        if (unit1 is None or unit1 == d) and (unit2 is None or unit2 == d):
+            return d
 
         raise EvalUnitError(
             self, 'Operator `or` expects dimensionless operands.')
@@ -3101,6 +3667,28 @@ class EvalUnitError(Exception):
             self.char = expr._token[3]
 
 
+def _eval_error(expr, subst, precision, err):
+    """
+    Creates an ``EvalError`` for an exception ``err`` that was raised while
+    evaluating ``expr``.
+
+    The ``_eval()`` methods and compiled evaluation functions don't handle
+    errors themselves, so the sub-expression that caused the error is found by
+    re-evaluating the operands of ``expr``. The first operand that raises an
+    error is searched in the same way, until an expression is found whose
+    operands can all be evaluated.
+    """
+    while True:
+        for op in expr._eval_operands(subst, precision):
+            try:
+                op._eval(subst, precision)
+            except (ArithmeticError, ValueError):
+                expr = op
+                break
+        else:
+            return EvalError(expr, subst, err)
+
+
 def _expr_error_message(owner, e):
     """
     Takes an ``EvalError`` or an ``EvalUnitError`` and traces the origins of
@@ -3117,20 +3705,19 @@ def _expr_error_message(owner, e):
         explaining the error.
 
     """
-    def path(root, target, trail=None):
-        # Find all name expressions leading up to e.expr
-        if trail is None:
-            trail = []
-        if root == target:
-            return trail
-        if isinstance(root, Name):
-            return path(root.rhs(), target, trail + [root])
-        else:
-            for child in root:
-                r = path(child, target, trail)
-                if r is not None:
-                    return r
-            return None
+    def path(root, target):
+        # Find all name expressions leading up to e.expr, using a depth-first
+        # search without recursion (so that deep expressions can be searched)
+        stack = [(root, [])]
+        while stack:
+            node, trail = stack.pop()
+            if node == target:
+                return trail
+            if isinstance(node, Name):
+                stack.append((node.rhs(), trail + [node]))
+            else:
+                stack.extend((op, trail) for op in reversed(node._operands))
+        return None
 
     # Show there was an error
     out = []
@@ -4,7 +4,6 @@
 # This file is part of Myokit.
 # See http://myokit.org for copyright, sharing, and licensing details.
 #
-import io
 import math
 import re
 
@@ -110,13 +109,13 @@ class ObjectWithMetaData:
             if ('\n' in v) or ('\r' in v) or (v.strip() == ''):
                 v.replace('\r\n', '\n')
                 v.replace('\r', '\n')
-                b.write(key + '"""\n')
+                b(key + '"""\n')
                 pre = TAB * (1 + tabs)
                 for line in v.split(eol):
-                    b.write(pre + line + eol)
-                b.write(pre + '"""\n')
+                    b(pre + line + eol)
+                b(pre + '"""\n')
             else:
-                b.write(key + v + eol)
+                b(key + v + eol)
 
 
 class ModelPart(ObjectWithMetaData):
@@ -149,16 +148,17 @@ class ModelPart(ObjectWithMetaData):
         """
         Returns this object in ``mmt`` syntax.
         """
-        b = io.StringIO()
-        self._code(b, 0)
-        return b.getvalue()
+        b = []
+        self._code(b.append, 0)
+        return ''.join(b)
 
     def _code(self, b, t):
         """
         Internal version of _code(), to be implemented by all subclasses.
 
         The argument ``t`` specifies the number of tabs to indent the code
-        with. The argument ``b`` is a StringIO buffer.
+        with. The argument ``b`` is a callable (e.g. ``list.append``) that
+        the code is passed to as a sequence of strings.
         """
         raise NotImplementedError
 
@@ -1144,18 +1144,18 @@ class Model(ObjectWithMetaData, VarProvider):
 
         Line numbers can be added by setting ``line_numbers=True``.
         """
-        b = io.StringIO()
-        b.write('[[model]]\n')
-        self._code(b, 0)
+        b = ['[[model]]\n']
+        self._code(b.append, 0)
+        b = ''.join(b)
         if line_numbers:
-            lines = b.getvalue().strip().split('\n')
+            lines = b.strip().split('\n')
             out = []
             n = int(math.ceil(math.log10(len(lines))))
             for k, line in enumerate(lines):
                 out.append('%*d ' % (n, 1 + k) + line)
             return '\n'.join(out) + '\n'
         else:
-            return b.getvalue()
+            return b
 
     def _code(self, b, t):
         """
@@ -1168,17 +1168,16 @@ class Model(ObjectWithMetaData, VarProvider):
         # Initial state
         if self._state_vars:
             pre = t * TAB
-            b.write(pre + '# Initial values\n')
+            b(pre + '# Initial values\n')
             names = [v.qname() for v in self._state_vars]
             values = [e.code() for e in self._state_init]
             n = max([len(name) for name in names])
             for name, value in zip(names, values):
-                b.write(pre + name + ' ' * (n - len(name)) + ' = '
-                        + value + '\n')
-            b.write(pre + '\n')
+                b(pre + name + ' ' * (n - len(name)) + ' = ' + value + '\n')
+            b(pre + '\n')
         else:
             # No initial state? Then add newline
-            b.write('\n')
+            b('\n')
 
         # Components
         for c in self.components(sort=True):
@@ -1375,13 +1374,16 @@ class Model(ObjectWithMetaData, VarProvider):
             To return ``NaN`` instead, set ``ignore_errors=True``.
 
         """
+        # Values are stored as Number objects that can be used directly as
+        # substitutions, so that they don't need to be checked and converted
+        # again for every equation.
         values = {}
 
         # Insert new state (if required)
         if state is not None:
             new_state = self.map_to_state(state)
             for state, value in zip(self._state_vars, new_state):
-                values[myokit.Name(state)] = value
+                values[myokit.Name(state)] = myokit.Number(float(value))
             state = None
 
         # Insert values of inputs (if required)
@@ -1389,31 +1391,29 @@ class Model(ObjectWithMetaData, VarProvider):
             for label, value in inputs.items():
                 var = self._bindings.get(label)
                 if var is not None:
-                    values[myokit.Name(var)] = float(value)
+                    values[myokit.Name(var)] = myokit.Number(float(value))
 
         # Get solvable order
         order = self.solvable_order()
 
         # Evaluate all variables in solvable order
-        if ignore_errors:
-            for group in order.values():
-                for eq in group:
-                    if eq.lhs in values:
-                        continue
-                    try:
-                        value = eq.rhs.eval(values, precision=precision)
-                    except myokit.NumericalError:
-                        value = float('nan')
-                    values[eq.lhs] = value
-        else:
-            for group in order.values():
-                for eq in group:
-                    if eq.lhs in values:
-                        continue
-                    values[eq.lhs] = eq.rhs.eval(values, precision=precision)
+        derivatives = {}
+        for group in order.values():
+            for eq in group:
+                if eq.lhs in values:
+                    continue
+                try:
+                    value = eq.rhs._evaluate(values, precision)
+                except myokit.NumericalError:
+                    if not ignore_errors:
+                        raise
+                    value = float('nan')
+                if eq.lhs.is_derivative():
+                    derivatives[eq.lhs] = value
+                values[eq.lhs] = myokit.Number(float(value))
 
         # Return calculated state
-        return [values[state.lhs()] for state in self._state_vars]
+        return [derivatives[state.lhs()] for state in self._state_vars]
 
     def eval_state_derivatives(
             self, state=None, inputs=None, precision=myokit.DOUBLE_PRECISION,
@@ -3783,20 +3783,20 @@ class Component(VarOwner):
         Internal version of Component.code()
         """
         pre = t * TAB
-        b.write(pre + '[' + self.name() + ']\n')
+        b(pre + '[' + self.name() + ']\n')
 
         # Append meta properties
         self._code_meta(b, t)
 
         # Append aliases
         for alias, var in sorted(self._alias_map.items()):
-            b.write(pre + 'use ' + var.qname() + ' as ' + alias + '\n')
+            b(pre + 'use ' + var.qname() + ' as ' + alias + '\n')
 
         # Append values
         for v in self.variables(sort=True):
             v._code(b, t)
 
-        b.write(pre + '\n')
+        b(pre + '\n')
 
     def qname(self, hide=None):
         """
@@ -4062,7 +4062,7 @@ class Variable(VarOwner):
         # Append header line
         pre = t * TAB
         eol = '\n'
-        b.write(pre + head + eol)
+        b(pre + head + eol)
 
         # Indent!
         t += 1
@@ -4070,15 +4070,15 @@ class Variable(VarOwner):
 
         # Append unit
         if unit is not None:
-            b.write(pre + 'in ' + str(unit) + eol)
+            b(pre + 'in ' + str(unit) + eol)
 
         # Append binding
         if bind:
-            b.write(pre + 'bind ' + bind + eol)
+            b(pre + 'bind ' + bind + eol)
 
         # Append label
         if label:
-            b.write(pre + 'label ' + label + eol)
+            b(pre + 'label ' + label + eol)
 
         # Append meta properties
         self._code_meta(b, t, ignore=omit)
@@ -5123,11 +5123,11 @@ class Equation:
 
     def code(self):
         """ Returns an ``.mmt`` representation of this equation. """
-        b = io.StringIO()
-        self._lhs._code(b, None)
-        b.write(' = ')
-        self._rhs._code(b, None)
-        return b.getvalue()
+        b = []
+        self._lhs._code(b.append, None)
+        b.append(' = ')
+        self._rhs._code(b.append, None)
+        return ''.join(b)
 
     def __hash__(self):
         # Note: Hash should never change during object's lifetime. This is
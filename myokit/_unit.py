@@ -341,6 +341,9 @@ class Unit:
         return self.__truediv__(other)
 
     def __eq__(self, other):
+        if self is other:
+            # Units are often compared to shared objects, e.g. dimensionless
+            return True
         if not isinstance(other, Unit):
             return False
 
@@ -187,10 +187,18 @@ class NumPyExpressionWriter(PythonExpressionWriter):
     This :class:`ExpressionWriter <myokit.formats.ExpressionWriter>` translates
     Myokit :class:`expressions <myokit.Expression>` to Python expressions
     intended for use in NumPy arrays.
+
+    By default, ``and``, ``or``, and ``not`` are written as Python operators,
+    which short-circuit but can not be used on arrays. To write them as
+    ``numpy.logical_and``, ``numpy.logical_or``, and ``numpy.logical_not``
+    instead, set ``elementwise_logic=True``. Note that this evaluates both
+    operands of ``and`` and ``or``, so that e.g. ``x != 0 and 1 / x > 2``
+    will evaluate ``1 / x`` even if ``x`` is zero.
     """
-    def __init__(self):
+    def __init__(self, elementwise_logic=False):
         super().__init__()
         self._function_prefix = 'numpy.'
+        self._elementwise_logic = bool(elementwise_logic)
     #def _ex_name(self, e):
     #def _ex_derivative(self, e):
     #def _ex_number(self, e):
@@ -222,15 +230,27 @@ class NumPyExpressionWriter(PythonExpressionWriter):
     #def _ex_floor(self, e):
     #def _ex_ceil(self, e):
     #def _ex_abs(self, e):
-    #def _ex_not(self, e):
+
+    def _ex_not(self, e):
+        if self._elementwise_logic:
+            return self._ex_function(e, 'logical_not')
+        return super()._ex_not(e)
     #def _ex_equal(self, e):
     #def _ex_not_equal(self, e):
     #def _ex_more(self, e):
     #def _ex_less(self, e):
     #def _ex_more_equal(self, e):
     #def _ex_less_equal(self, e):
-    #def _ex_and(self, e):
-    #def _ex_or(self, e):
+
+    def _ex_and(self, e):
+        if self._elementwise_logic:
+            return self._ex_function(e, 'logical_and')
+        return super()._ex_and(e)
+
+    def _ex_or(self, e):
+        if self._elementwise_logic:
+            return self._ex_function(e, 'logical_or')
+        return super()._ex_or(e)
 
     def _ex_if(self, e):
         return self._function_prefix + 'select([' + self.ex(e._i) + '], [' \
@@ -232,6 +232,17 @@ class AuxTest(unittest.TestCase):
         x.set_rhs('5 + x')
         self.assertEqual(w.ex(x.rhs()), '5.0 + c_x')
 
+        # Writers are shared, with a separate one for element-wise logic
+        self.assertIs(myokit.numpy_writer(), w)
+        v = myokit.numpy_writer(elementwise_logic=True)
+        self.assertIsNot(v, w)
+        self.assertIs(myokit.numpy_writer(True), v)
+        e = myokit.parse_expression('x > 1 and not (x > 2)')
+        self.assertEqual(w.ex(e), '((x > 1.0) and not ((x > 2.0)))')
+        self.assertEqual(
+            v.ex(e),
+            'numpy.logical_and((x > 1.0), numpy.logical_not((x > 2.0)))')
+
     def test_python_writer(self):
         # Test Python expression writer obtaining method.
 
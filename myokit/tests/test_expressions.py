@@ -7,6 +7,7 @@
 #
 import pickle
 import unittest
+import warnings
 
 import numpy as np
 
@@ -261,6 +262,57 @@ class ExpressionTest(unittest.TestCase):
             else:
                 self.assertNotEqual(e1, e2)
 
+    def test_hash(self):
+        # Test hashing of expressions
+
+        # Equal expressions have equal hashes
+        pe = myokit.parse_expression
+        a = pe('1 + sqrt(2 * log(3, 4)) / -x')
+        b = pe('1 + sqrt(2 * log(3, 4)) / -x')
+        self.assertIsNot(a, b)
+        self.assertEqual(a, b)
+        self.assertEqual(hash(a), hash(b))
+        self.assertNotEqual(hash(a), hash(pe('1 + sqrt(2 * log(3, 5)) / -x')))
+
+        # A prefix plus is ignored when comparing operands
+        a, b = pe('1 + +2'), pe('1 + 2')
+        self.assertEqual(a, b)
+        self.assertEqual(hash(a), hash(b))
+
+        # Names and derivatives are hashed without creating polish strings
+        m = myokit.Model()
+        c = m.add_component('c')
+        x, y = c.add_variable('x'), c.add_variable('y')
+        x.promote(1)
+        for a, b in ((myokit.Name(x), myokit.Name(x)),
+                     (myokit.Derivative(myokit.Name(x)),
+                      myokit.Derivative(myokit.Name(x))),
+                     (myokit.PartialDerivative(x.lhs(), myokit.Name(y)),
+                      myokit.PartialDerivative(x.lhs(), myokit.Name(y)))):
+            self.assertEqual(hash(a), hash(b))
+            self.assertIsNone(a._cached_polish)
+            self.assertEqual(a, b)
+
+        # Composite expressions are hashed without creating polish strings
+        a = pe('if(not 1 > 2, 3 + sqrt(4), 6 * log(7, 8))')
+        hash(a)
+        for e in a.walk():
+            if e._operands:
+                self.assertIsNone(e._cached_polish)
+
+    def test_polish(self):
+        # Test that only the expression on which _polish() is called caches
+        # its string, not its operands
+
+        a = myokit.parse_expression(
+            'if(not 1 > 2, +3 + sqrt(-4), 6 * log(7, 8))')
+        s = a._polish()
+        self.assertIs(a._cached_polish, s)
+        self.assertEqual(s, 'if 3 > not 1 2 + 3 sqrt 1 ~ 4 * 6 log 2 7 8')
+        for op in a.walk():
+            if op is not a:
+                self.assertIsNone(op._cached_polish)
+
     def test_eval(self):
         # Test :meth:`Expression.eval()`.
 
@@ -350,6 +402,254 @@ class ExpressionTest(unittest.TestCase):
         self.assertEqual(
             x._eval_unit(myokit.UNIT_STRICT), myokit.units.dimensionless)
 
+    def test_eval_compiled(self):
+        # Test repeated evaluation, using a compiled function
+
+        pe = myokit.parse_expression
+        codes = [
+            '1 + 2 * sqrt(3 + 4 / 5 * exp(-6 / 7)) - (12 + 13 * 14) % 5',
+            '-1 ^ 2 + (-1) ^ 2 + 2 ^ -1 + 7 // 2 - -7 % 3 + log(8, 2)',
+            'sin(1) + cos(1) + tan(1) + asin(0.5) + acos(0.5) + atan(1)',
+            'floor(-2.5) + ceil(2.1) + abs(-3) + log(3) + log10(100)',
+            'if(1 >= 2, 3, 4) + piecewise(1 > 2, 3, 4 <= 4, 5, 6)',
+            '1 == 1 and 2 != 3 or not 4 < 5',
+        ]
+        for code in codes:
+            e = pe(code)
+            x = e.eval()
+            self.assertIs(e._cached_eval, False)
+            y = e.eval()
+            self.assertTrue(callable(e._cached_eval))
+            self.assertEqual(x, y)
+            self.assertEqual(type(x), type(y))
+
+        # Division by a non-zero literal doesn't need a zero check
+        e = pe('1 / 4 + 1 / 0.5')
+        self.assertNotIn('_divide', e._compile_eval().__code__.co_names)
+        e = pe('1 / (4 - 2)')
+        self.assertIn('_divide', e._compile_eval().__code__.co_names)
+
+        # Literal conditions are evaluated when compiling
+        def code(e):
+            b = []
+            e._eval_code(b.append, [])
+            return ''.join(b)
+
+        e = pe('(1 == 1 and 2 < 3) or 1 > 2')
+        self.assertEqual(code(e), 'True')
+        self.assertIs(e._compile_eval()(None, myokit.DOUBLE_PRECISION), True)
+        e = pe('1 / 0 > 1 and 2 > 1')
+        self.assertIn('_divide', e._compile_eval().__code__.co_names)
+
+        # Single precision is not compiled
+        e = pe('1 + 2')
+        e.eval(precision=myokit.SINGLE_PRECISION)
+        self.assertIsNone(e._cached_eval)
+
+        # References are evaluated when called, using substitutions
+        m = myokit.Model()
+        c = m.add_component('c')
+        x = c.add_variable('x', rhs=2)
+        y = c.add_variable('y', rhs='1 / 0')
+        z = c.add_variable('z', rhs='3 * x + if(x > 2, y, 1)')
+        e = z.rhs()
+        self.assertEqual(e.eval(), 7)
+        self.assertEqual(e.eval(), 7)
+        x.set_rhs(1)
+        self.assertEqual(e.eval(), 4)
+        self.assertEqual(e.eval(subst={x.lhs(): myokit.Number(0.5)}), 2.5)
+
+        # Errors are still raised with the same message
+        x.set_rhs(3)
+        with self.assertRaises(myokit.NumericalError) as e1:
+            e.eval()
+        with self.assertRaises(myokit.NumericalError) as e2:
+            e.eval()
+        self.assertEqual(str(e1.exception), str(e2.exception))
+        self.assertIn('c.y = 1 / 0', str(e2.exception))
+
+        # Right-hand sides of references are compiled too
+        x.set_rhs('1 + 1')
+        e = z.rhs()
+        e.eval()
+        e.eval()
+        self.assertTrue(callable(x.rhs()._cached_eval))
+        self.assertEqual(e.eval(), 7)
+
+        # Repeated references are evaluated once, and only when needed
+        x.set_rhs(1)
+        z.set_rhs('x * x + if(x > 2, y, x) + if(x > 2, y, 1)')
+        e = z.rhs()
+        f = e._compile_eval()
+        self.assertEqual(len(f.__globals__['_o']), 2)
+        self.assertEqual(f(None, myokit.DOUBLE_PRECISION), 3)
+        self.assertEqual(e.eval(), 3)
+        self.assertEqual(e.eval(), 3)
+        self.assertEqual(e.eval(subst={x.lhs(): myokit.Number(2)}), 7)
+
+        # Literal first operands of and/or are dropped
+        tests = (
+            ('1 == 1 and x > 0', True), ('1 == 2 and x > 0', False),
+            ('1 == 1 or x > 3', True), ('1 == 2 or x > 3', False))
+        for rhs, r in tests:
+            z.set_rhs(rhs)
+            self.assertNotIn('==', code(z.rhs()))
+            f = z.rhs()._compile_eval()
+            self.assertEqual(f(None, myokit.DOUBLE_PRECISION), r)
+
+        # Very deeply nested expressions fall back to _eval
+        e = myokit.Number(1)
+        for i in range(500):
+            e = myokit.Plus(e, myokit.Number(i))
+        self.assertEqual(e.eval(), e.eval())
+        self.assertEqual(e.eval(), 124751)
+
+        # The sub-expression that caused an error raised by a compiled
+        # function is found, without looking in untaken branches
+        x.set_rhs(0)
+        y.set_rhs('1 / x')
+        z.set_rhs('if(x > 0, 1 / (x - x), 2 + sqrt(4) / y)')
+        e = z.rhs()
+        for i in range(2):
+            with self.assertRaises(myokit.NumericalError) as e1:
+                e.eval()
+        self.assertTrue(callable(e._cached_eval))
+        m = str(e1.exception).splitlines()
+        self.assertEqual(m[3], 'Error located at:')
+        self.assertEqual(m[4], '  c.y')
+        self.assertEqual(m[5], 'c.y = 1 / c.x')
+        self.assertEqual(m[6], '      ~~~~~~~')
+        with self.assertRaises(ZeroDivisionError) as e2:
+            e._cached_eval(None, myokit.DOUBLE_PRECISION)
+        err = myokit._expressions._eval_error(
+            e, None, myokit.DOUBLE_PRECISION, e2.exception)
+        self.assertIs(err.expr, y.rhs())
+        self.assertIs(err.err, e2.exception)
+
+    def test_eval_functions(self):
+        # Functions use math for floats, but keep numpy's results
+
+        pe = myokit.parse_expression
+        tests = [
+            (pe('sqrt(4)'), 2),
+            (pe('floor(-1.5) + ceil(1.5)'), 0),
+            (pe('log(0)'), -float('inf')),
+            (pe('exp(1000)'), float('inf')),
+        ]
+        nans = [pe('sqrt(-1)'), pe('asin(2)'), pe('log(-1)')]
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            for i in range(3):  # Evaluate recursively, then compiled
+                for e, x in tests:
+                    self.assertEqual(e.eval(), x)
+                for e in nans:
+                    self.assertTrue(np.isnan(e.eval()))
+        codes = ('floor(1.5)', 'ceil(1.5)', 'tan(1)', 'sqrt(4)', 'abs(-2)')
+        for code in codes:
+            self.assertIsInstance(pe(code).eval(), np.float64)
+
+        # Results are numpy floats, so further arithmetic follows numpy rules
+        tests = [
+            (pe('log(2, 1)'), float('inf')),
+            (pe('log(8, exp(0))'), float('inf')),
+            (pe('floor(1.5) // 0'), float('inf')),
+            (pe('exp(2) ^ 1000'), float('inf')),
+            (pe('exp(10) ^ 400'), float('inf')),
+        ]
+        nans = [pe('sqrt(4) % 0'), pe('abs(-2) % 0')]
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            for i in range(3):
+                for e, x in tests:
+                    self.assertEqual(e.eval(), x)
+                for e in nans:
+                    self.assertTrue(np.isnan(e.eval()))
+
+        # Zero results of floor and ceil keep their sign, as in numpy
+        for code in ('ceil(-0.3)', 'ceil(-0.0)', 'floor(-0.0)'):
+            x = pe(code).eval()
+            self.assertEqual(x, 0)
+            self.assertTrue(np.signbit(x), code)
+        self.assertFalse(np.signbit(pe('floor(0.3)').eval()))
+
+        # Results are identical to eval_many() and pyfunc()
+        m = myokit.Model()
+        c = m.add_component('c')
+        x = c.add_variable('x', rhs=1)
+        # Note: Number(-0.0) is stored as 0.0, so signs are only compared for
+        # non-zero input
+        xs = np.concatenate((np.linspace(-3.7, 3.7, 37), [-0.3, 0.0]))
+        nz = xs != 0
+        codes = [
+            'sqrt(c.x)', 'sin(c.x)', 'cos(c.x)', 'tan(c.x)', 'asin(c.x / 4)',
+            'acos(c.x / 4)', 'atan(c.x)', 'exp(c.x)', 'log(c.x)',
+            'log10(c.x)', 'floor(c.x)', 'ceil(c.x)', 'abs(c.x)',
+        ]
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            for code in codes:
+                e = pe(code, context=m)
+                r = e.eval_many({x.lhs(): xs})
+                s = np.array([e.eval(subst={x.lhs(): v}) for v in xs])
+                np.testing.assert_array_equal(s, r, err_msg=code)
+                self.assertTrue(np.array_equal(
+                    np.signbit(s[nz]), np.signbit(r[nz])), code)
+
+        # Single precision is evaluated with numpy
+        x = pe('exp(sqrt(2))').eval(precision=myokit.SINGLE_PRECISION)
+        self.assertIsInstance(x, np.float32)
+
+    def test_eval_many(self):
+        # Test Expression.eval_many()
+
+        m = myokit.Model()
+        c = m.add_component('c')
+        x = c.add_variable('x', rhs=2)
+        y = c.add_variable('y', rhs='3 * x')
+        z = c.add_variable('z', rhs='exp(-x) + y / 2 + if(x > 1, 1, 2)')
+        a = c.add_variable('a', rhs='z - 1')
+        e = a.rhs()
+
+        # Arrays, with substitution also applied to references
+        xs = np.linspace(0, 3, 7)
+        r = e.eval_many({x.lhs(): xs})
+        self.assertEqual(r.shape, xs.shape)
+        self.assertEqual(r.dtype, np.float64)
+        self.assertTrue(np.allclose(
+            r, [e.eval(subst={x.lhs(): v}) for v in xs]))
+
+        # Expressions and scalars are broadcast
+        xs = np.array([[1, 2], [3, 4]])
+        r = e.eval_many({x.lhs(): xs, y.lhs(): myokit.Number(3)})
+        self.assertEqual(r.shape, (2, 2))
+        self.assertEqual(
+            r[1, 0], e.eval(subst={x.lhs(): 3, y.lhs(): myokit.Number(3)}))
+        r = e.eval_many({x.lhs(): 1})
+        self.assertEqual(r.shape, ())
+        self.assertEqual(r, e.eval(subst={x.lhs(): 1}))
+        r = myokit.parse_expression('1 + 2').eval_many()
+        self.assertEqual(r, 3)
+
+        # Conditions are evaluated element-wise
+        e = myokit.parse_expression(
+            'piecewise(c.x > 1 and not c.x > 2, 1, c.x < 0 or c.x >= 3, 2, 3)',
+            context=m)
+        xs = np.linspace(-1, 4, 11)
+        r = e.eval_many({x.lhs(): xs})
+        self.assertEqual(
+            list(r), [e.eval(subst={x.lhs(): v}) for v in xs])
+        e = a.rhs()
+
+        # Single precision
+        r = e.eval_many(
+            {x.lhs(): [1, 2]}, precision=myokit.SINGLE_PRECISION)
+        self.assertEqual(r.dtype, np.float32)
+
+        # Invalid substitutions
+        self.assertRaisesRegex(ValueError, 'dict', e.eval_many, 3)
+        self.assertRaisesRegex(
+            ValueError, 'LhsExpression', e.eval_many, {3: 3})
+
     def test_eval_unit_error(self):
         # Test error handling for eval_unit.
 
@@ -362,6 +662,30 @@ class ExpressionTest(unittest.TestCase):
         self.assertEqual(m[2], '  1 + 2 * (3 + 4 * (5 [mV] + 6 [A]))')
         self.assertEqual(m[3], '                    ~~~~~~~~~~~~~~')
 
+        # Errors are cached, but still raised
+        self.assertRaises(myokit.IncompatibleUnitError, x.eval_unit)
+
+    def test_eval_unit_caching(self):
+        # Test caching of eval_unit results.
+
+        # Literal expressions are cached
+        x = myokit.parse_expression('1 [mV] + 2 [mV]')
+        self.assertEqual(x.eval_unit(), myokit.units.mV)
+        self.assertEqual(x._cached_unit, [None, myokit.units.mV])
+        self.assertEqual(x.eval_unit(myokit.UNIT_STRICT), myokit.units.mV)
+        self.assertEqual(x._cached_unit, [myokit.units.mV, myokit.units.mV])
+
+        # Expressions with references are not, as variable units can change
+        m = myokit.Model()
+        c = m.add_component('c')
+        v = c.add_variable('v')
+        v.set_rhs(3)
+        v.set_unit('mV')
+        x = myokit.Plus(myokit.Name(v), myokit.Number(2, 'mV'))
+        self.assertEqual(x.eval_unit(), myokit.units.mV)
+        v.set_unit('V')
+        self.assertRaises(myokit.IncompatibleUnitError, x.eval_unit)
+
     def test_int_conversion(self):
         # Test conversion of expressions to int.
 
@@ -414,6 +738,50 @@ class ExpressionTest(unittest.TestCase):
         self.assertEqual(f(4), 6)
         self.assertEqual(list(f(np.array([1, 4, 9]))), [3, 6, 9])
 
+        # Generated functions are cached, until the code changes
+        self.assertIs(x.pyfunc(use_numpy=True), f)
+        self.assertIsNot(x.pyfunc(use_numpy=False), f)
+        m = myokit.Model()
+        v = m.add_component('c').add_variable('v')
+        x = myokit.Multiply(myokit.Number(3), myokit.Name(v))
+        f = x.pyfunc()
+        self.assertIs(x.pyfunc(), f)
+        self.assertEqual(f(c_v=2), 6)
+        v.rename('w')
+        g = x.pyfunc()
+        self.assertIsNot(g, f)
+        self.assertEqual(g(c_w=2), 6)
+
+        # Argument order can be set
+        u = m.get('c').add_variable('u')
+        x = myokit.Minus(myokit.Name(u), myokit.Name(v))
+        f = x.pyfunc(args=[myokit.Name(u), myokit.Name(v)])
+        self.assertEqual(f(5, 3), 2)
+        f = x.pyfunc(args=[myokit.Name(v), myokit.Name(u)])
+        self.assertEqual(f(5, 3), -2)
+        self.assertIs(x.pyfunc(args=[myokit.Name(v), myokit.Name(u)]), f)
+
+        # Extra arguments are allowed, missing ones are not
+        f = x.pyfunc(args=[myokit.Name(v), myokit.Derivative(myokit.Name(v)),
+                           myokit.Name(u)])
+        self.assertEqual(f(5, 0, 3), -2)
+        self.assertRaisesRegex(
+            ValueError, 'must include all', x.pyfunc, args=[myokit.Name(v)])
+
+        # Logical operators short-circuit, so guarded conditions work
+        x = myokit.parse_expression(
+            'if(c.u != 0 and 1 / c.u > 2, 1, 2)', context=m)
+        for use_numpy in (True, False):
+            f = x.pyfunc(use_numpy=use_numpy)
+            self.assertEqual(f(0.0), 2)
+            self.assertEqual(f(0.25), 1)
+        x = myokit.parse_expression(
+            'if(not (c.u == 0 or 1 / c.u < 2), 1, 2)', context=m)
+        for use_numpy in (True, False):
+            f = x.pyfunc(use_numpy=use_numpy)
+            self.assertEqual(f(0.0), 2)
+            self.assertEqual(f(0.25), 1)
+
     def test_pystr(self):
         # Test the pystr() method.
         # Note: Extensive testing happens in pywriter / numpywriter tests!
@@ -422,6 +790,32 @@ class ExpressionTest(unittest.TestCase):
         self.assertEqual(x.pystr(use_numpy=False), '3.0 * math.sqrt(v)')
         self.assertEqual(x.pystr(use_numpy=True), '3.0 * numpy.sqrt(v)')
 
+    def test_references(self):
+        # Test :meth:`Expression.references()`.
+
+        m = myokit.Model()
+        c = m.add_component('c')
+        x = c.add_variable('x')
+        y = c.add_variable('y')
+        a, b = myokit.Name(x), myokit.Name(y)
+
+        e = myokit.Plus(a, myokit.Number(2))
+        self.assertEqual(e.references(), set([a]))
+        e = myokit.Multiply(e, myokit.Minus(b, a))
+        self.assertEqual(e.references(), set([a, b]))
+        self.assertEqual(myokit.Number(1).references(), set())
+
+        # Sets are shared with operands that contain all references
+        f = myokit.Plus(myokit.Name(y), e)
+        self.assertIs(f._references, e._references)
+        f = myokit.Plus(e, myokit.Divide(myokit.Name(x), myokit.Number(3)))
+        self.assertIs(f._references, e._references)
+
+        # Returned sets can be modified without affecting the expression
+        refs = e.references()
+        refs.add(myokit.Name(c.add_variable('z')))
+        self.assertEqual(e.references(), set([a, b]))
+
     def test_sequence_interface(self):
         # Tests the Expression class's sequence interface
 
@@ -439,6 +833,24 @@ class ExpressionTest(unittest.TestCase):
         self.assertEqual(y[0], myokit.Number(1))
         self.assertEqual(y[1], myokit.Number(2))
 
+        # Operands are checked by identity first
+        a = myokit.parse_expression('1 + sqrt(2)')
+        b = myokit.parse_expression('3 + sqrt(4)')
+        x = myokit.Multiply(a, b)
+        self.assertIn(b, x)
+        self.assertIsNone(a._cached_hash)
+        self.assertIn(myokit.parse_expression('3 + sqrt(4)'), x)
+        self.assertNotIn(myokit.parse_expression('3 + sqrt(5)'), x)
+
+    def test_slots(self):
+        # Expressions use __slots__, and don't have a __dict__
+
+        x = myokit.parse_expression(
+            'if(1 > 2, sqrt(3) + 4 * -5, piecewise(6 < 7, 8, 9)) / dot(v)')
+        for e in x.walk():
+            self.assertFalse(hasattr(e, '__dict__'))
+        self.assertRaises(AttributeError, setattr, x, 'y', 3)
+
     def test_string_conversion(self):
         # Tests __str__ and __repr__
 
@@ -529,6 +941,7 @@ class NumberTest(unittest.TestCase):
         self.assertEqual(str(y), '4')
         self.assertEqual(x, y)
         self.assertFalse(x is y)
+        self.assertEqual(x._polish(), y._polish())
         x = myokit.Number(4.01)
         self.assertEqual(str(x), '4.01')
         x = myokit.Number(-4.01)
@@ -543,6 +956,14 @@ class NumberTest(unittest.TestCase):
         self.assertEqual(str(x), '4e-5')
         x = myokit.Number('4e+15')
         self.assertEqual(float(x), 4e15)
+        x = myokit.Number('1e+300')
+        self.assertEqual(str(x), '1e+300')
+        x = myokit.Number('1e+100')
+        self.assertEqual(str(x), '1e+100')
+        x = myokit.Number('1e+99')
+        self.assertEqual(str(x), '1e99')
+        x = myokit.Number('1e-300')
+        self.assertEqual(str(x), '1e-300')
         x = myokit.Number(4, myokit.Unit.parse_simple('pF'))
         self.assertEqual(str(x), '4 [pF]')
         x = myokit.Number(-3, myokit.Unit.parse_simple('pF'))
@@ -590,7 +1011,7 @@ class NumberTest(unittest.TestCase):
 
         x = myokit.Number(2)
         y = x.clone()
-        self.assertIsNot(x, y)
+        self.assertIs(x, y)
         self.assertEqual(x, y)
 
         # With substitution
@@ -649,6 +1070,14 @@ class NumberTest(unittest.TestCase):
         self.assertEqual(
             type(x.eval(precision=myokit.SINGLE_PRECISION)), np.float32)
 
+        # Single and double precision values can be mixed
+        x = myokit.Number(0.1)
+        self.assertEqual(x.eval(precision=myokit.SINGLE_PRECISION),
+                         np.float32(0.1))
+        self.assertEqual(x.eval(), 0.1)
+        self.assertEqual(x.eval(precision=myokit.SINGLE_PRECISION),
+                         np.float32(0.1))
+
     def test_eval_unit(self):
         # Test Number eval_unit.
 
@@ -1084,7 +1513,7 @@ class DerivativeTest(unittest.TestCase):
         # Test Derivative.clone().
         x = myokit.Derivative(myokit.Name('x'))
         y = x.clone()
-        self.assertIsNot(y, x)
+        self.assertIs(y, x)
         self.assertEqual(y, x)
 
         z = myokit.Derivative(myokit.Name('z'))
@@ -1314,7 +1743,7 @@ class PartialDerivativeTest(unittest.TestCase):
         m = myokit.Name('w')
         p = myokit.PartialDerivative(n, n)
         self.assertEqual(p, p.clone())
-        self.assertFalse(p is p.clone())
+        self.assertIs(p, p.clone())
         self.assertEqual(p.clone(subst={n: m}), myokit.PartialDerivative(m, m))
         self.assertEqual(p.clone(subst={p: m}), m)
 
@@ -1395,7 +1824,7 @@ class PrefixPlusTest(unittest.TestCase):
         # Test PrefixPlus.clone().
         x = myokit.PrefixPlus(myokit.Number(3))
         y = x.clone()
-        self.assertIsNot(y, x)
+        self.assertIs(y, x)
         self.assertEqual(y, x)
 
         z = myokit.PrefixPlus(myokit.Number(4))
@@ -1498,7 +1927,7 @@ class PrefixMinusTest(unittest.TestCase):
         # Test PrefixMinus.clone().
         x = myokit.PrefixMinus(myokit.Number(3))
         y = x.clone()
-        self.assertIsNot(y, x)
+        self.assertIs(y, x)
         self.assertEqual(y, x)
 
         z = myokit.PrefixMinus(myokit.Number(4))
@@ -1541,6 +1970,14 @@ class PrefixMinusTest(unittest.TestCase):
         self.assertTrue(p.is_number(0))
         self.assertEqual(p.unit(), 1 / myokit.units.nS)
 
+        # Double negations are cancelled
+        V.set_rhs('-(-ina.I1)')
+        p = V.rhs().diff(g.lhs())
+        self.assertEqual(p.code(), 'diff(ina.I1, ina.g)')
+        V.set_rhs('-(1 - ina.I1)')
+        p = V.rhs().diff(g.lhs())
+        self.assertEqual(p.code(), 'diff(ina.I1, ina.g)')
+
     def test_eval(self):
         # Test PrefixMinus evaluation.
 
@@ -1604,7 +2041,7 @@ class PlusTest(unittest.TestCase):
         j = myokit.Number(4)
         x = myokit.Plus(i, j)
         y = x.clone()
-        self.assertIsNot(y, x)
+        self.assertIs(y, x)
         self.assertEqual(y, x)
 
         z = myokit.Plus(j, i)
@@ -1623,6 +2060,17 @@ class PlusTest(unittest.TestCase):
         self.assertNotEqual(x, y)
         self.assertEqual(y, myokit.Plus(i, i))
 
+        # Unchanged operands are not copied
+        k = myokit.Number(5)
+        x = myokit.Plus(myokit.Plus(i, j), myokit.Sqrt(j))
+        y = x.clone(subst={j: k})
+        self.assertEqual(y, myokit.Plus(myokit.Plus(i, k), myokit.Sqrt(k)))
+        self.assertIs(y[0][0], x[0][0])
+        y = x.clone(subst={myokit.Sqrt(j): k})
+        self.assertEqual(y, myokit.Plus(myokit.Plus(i, j), k))
+        self.assertIs(y[0], x[0])
+        self.assertIs(x.clone(subst={k: i}), x)
+
     def test_bracket(self):
         # Test Plus.bracket().
         i = myokit.Number(1)
@@ -2207,7 +2655,7 @@ class PowerTest(unittest.TestCase):
         j = myokit.Number(4)
         x = myokit.Power(i, j)
         y = x.clone()
-        self.assertIsNot(y, x)
+        self.assertIs(y, x)
         self.assertEqual(y, x)
 
         z = myokit.Power(j, i)
@@ -2365,7 +2813,7 @@ class SqrtTest(unittest.TestCase):
         j = myokit.Number(10)
         x = myokit.Sqrt(i)
         y = x.clone()
-        self.assertIsNot(y, x)
+        self.assertIs(y, x)
         self.assertEqual(y, x)
 
         z = myokit.Sqrt(j)
@@ -2463,7 +2911,7 @@ class ExpTest(unittest.TestCase):
         j = myokit.Number(10)
         x = myokit.Exp(i)
         y = x.clone()
-        self.assertIsNot(y, x)
+        self.assertIs(y, x)
         self.assertEqual(y, x)
 
         z = myokit.Exp(j)
@@ -2590,7 +3038,7 @@ class LogTest(unittest.TestCase):
         j = myokit.Number(10)
         x = myokit.Log(i)
         y = x.clone()
-        self.assertIsNot(y, x)
+        self.assertIs(y, x)
         self.assertEqual(y, x)
 
         z = myokit.Log(j)
@@ -2608,7 +3056,7 @@ class LogTest(unittest.TestCase):
         # Test with two operands
         x = myokit.Log(i, j)
         y = x.clone()
-        self.assertIsNot(y, x)
+        self.assertIs(y, x)
         self.assertEqual(y, x)
 
         z = myokit.Log(j, i)
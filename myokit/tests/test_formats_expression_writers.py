@@ -7,6 +7,8 @@
 #
 import unittest
 
+import numpy as np
+
 import myokit
 import myokit.formats
 import myokit.formats.ansic
@@ -967,6 +969,25 @@ class NumPyExpressionWriterTest(unittest.TestCase):
             w.ex(x),
             'numpy.select([(5.0 > 3.0), (2.0 < 1.0)], [c.a, 12.0], 1.0)')
 
+        # Element-wise logic
+        w = myokit.formats.python.NumPyExpressionWriter(elementwise_logic=True)
+        w.set_lhs_function(lambda v: v.var().name())
+        x = myokit.Not(cond1)
+        self.assertEqual(w.ex(x), 'numpy.logical_not((5.0 > 3.0))')
+        x = myokit.And(cond1, cond2)
+        self.assertEqual(
+            w.ex(x), 'numpy.logical_and((5.0 > 3.0), (2.0 < 1.0))')
+        x = myokit.Or(cond1, cond2)
+        self.assertEqual(w.ex(x), 'numpy.logical_or((5.0 > 3.0), (2.0 < 1.0))')
+
+        # Conditions can then be evaluated element-wise on arrays
+        x = myokit.parse_expression(
+            'piecewise(c.a > 1 and not (c.a > 2), 1,'
+            '          c.a < 0 or c.a >= 3, 2, 3)',
+            context=model)
+        r = eval(w.ex(x), {'numpy': np, 'a': np.array([-1, 0, 1.5, 2, 3])})
+        self.assertEqual(list(r), [2, 3, 1, 1, 2])
+
         # Test fetching using ewriter method
         w = myokit.formats.ewriter('numpy')
         self.assertIsInstance(w, myokit.formats.python.NumPyExpressionWriter)
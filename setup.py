@@ -17,7 +17,7 @@ del os, sys
 
 
 # Load text for description and license
-with open('README.md') as f:
+with open('README.md', encoding='utf-8') as f:
     readme = f.read()
 
 